@@ -0,0 +1,482 @@
+"""
+Caches for PNGBytesCodec.
+
+Seeded encodes and all decodes are deterministic, so their results can be
+reused. CodecCache keeps recent results, and LayoutCache the seeded walk
+layouts behind them, in an in-memory LRU and, optionally, in an on-disk
+tier shared between processes.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from .codec import PNGBytesCodec, ScratchArena, WalkLayout
+
+
+@dataclass
+class CacheStats:
+    """Hit/miss counters of a CodecCache."""
+
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class _TieredCache:
+    """
+    In-memory LRU in front of an optional on-disk tier.
+
+    The disk tier stores one file per entry, written to a temporary file and
+    renamed into place, so several processes can share a cache directory.
+    When it grows past ``disk_bytes`` the least recently used entries are
+    removed. Subclasses convert their values to and from the bytes kept on
+    disk with _dump() and _load().
+    """
+
+    # bump to invalidate entries written by older codec versions
+    _KEY_VERSION = 1
+
+    # the disk tier is only listed when its tracked size passes the cap, or
+    # every EVICT_SCAN_INTERVAL writes to pick up other processes' entries
+    EVICT_SCAN_INTERVAL = 256
+    EVICT_LOW_WATER = 0.9  # fraction of disk_bytes kept after an eviction
+
+    def __init__(
+        self,
+        cache_dir: str | Path | None = None,
+        *,
+        memory_items: int = 128,
+        disk_bytes: int = 256 << 20,
+        codec=PNGBytesCodec,
+    ) -> None:
+        """
+        Args:
+            cache_dir: Directory of the on-disk tier (None for memory only);
+                a leading ``~`` is expanded
+            memory_items: Maximum number of entries kept in memory
+            disk_bytes: Size cap of the on-disk tier
+            codec: Codec class whose results are cached
+        """
+        self.cache_dir = (
+            Path(cache_dir).expanduser() if cache_dir is not None else None
+        )
+        self.memory_items = memory_items
+        self.disk_bytes = disk_bytes
+        self.codec = codec
+        self.stats = CacheStats()
+
+        self._memory: OrderedDict[str, object] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_usage: int | None = None  # unknown until the first scan
+        self._writes_since_scan = 0
+
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+        for _, _, path in self._disk_entries():
+            self._unlink(path)
+        with self._lock:
+            self._disk_usage = None
+
+    def _dump(self, value) -> bytes:
+        """Serialize a value for the disk tier."""
+        return value
+
+    def _load(self, raw: bytes):
+        """Rebuild a value read from the disk tier."""
+        return raw
+
+    def _key(self, operation: str, params: dict, content: bytes) -> str:
+        """Hash the operation, its parameters and the content into a key."""
+        digest = hashlib.sha256()
+        header = {"v": self._KEY_VERSION, "op": operation, **params}
+        digest.update(json.dumps(header, sort_keys=True).encode())
+        digest.update(b"\x00")
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _get(self, key: str):
+        """Look a key up in memory, then on disk, updating the stats."""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.stats.memory_hits += 1
+                return value
+
+        raw = self._disk_get(key)
+        with self._lock:
+            if raw is None:
+                self.stats.misses += 1
+                return None
+            self.stats.disk_hits += 1
+        value = self._load(raw)
+        self._memory_put(key, value)
+        return value
+
+    def _put(self, key: str, value) -> None:
+        """Store a value in both tiers."""
+        self._memory_put(key, value)
+        if self.cache_dir is not None:
+            self._disk_put(key, self._dump(value))
+
+    def _memory_put(self, key: str, value) -> None:
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def _disk_get(self, key: str) -> bytes | None:
+        if self.cache_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            value = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        # refresh recency for eviction, another process may have removed it
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return value
+
+    def _disk_put(self, key: str, value: bytes) -> None:
+        if self.cache_dir is None or len(value) > self.disk_bytes:
+            return
+        path = self._disk_path(key)
+        path.parent.mkdir(exist_ok=True)
+
+        # write then rename so readers never see a partial entry
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(value)
+            os.replace(tmp_name, path)
+        except BaseException:
+            self._unlink(Path(tmp_name))
+            raise
+
+        with self._lock:
+            if self._disk_usage is not None:
+                self._disk_usage += len(value)
+            self._writes_since_scan += 1
+            scan = (
+                self._disk_usage is None
+                or self._disk_usage > self.disk_bytes
+                or self._writes_since_scan >= self.EVICT_SCAN_INTERVAL
+            )
+        if scan:
+            self._evict()
+
+    def _disk_entries(self) -> list:
+        """List (mtime, size, path) of every finished entry on disk."""
+        if self.cache_dir is None:
+            return []
+        entries = []
+        for path in self.cache_dir.glob("??/*"):
+            if path.suffix == ".tmp":
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self) -> None:
+        """
+        Rescan the disk tier and, when over the size cap, remove least
+        recently used entries down to EVICT_LOW_WATER of it.
+        """
+        entries = self._disk_entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.disk_bytes:
+            target = int(self.disk_bytes * self.EVICT_LOW_WATER)
+            for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+                if total <= target:
+                    break
+                if self._unlink(path):
+                    with self._lock:
+                        self.stats.evictions += 1
+                total -= size
+
+        with self._lock:
+            self._disk_usage = total
+            self._writes_since_scan = 0
+
+    @staticmethod
+    def _unlink(path: Path) -> bool:
+        """Remove a file, tolerating concurrent removal by another process."""
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return False
+        return True
+
+
+class CodecCache(_TieredCache):
+    """
+    Content-addressed cache around PNGBytesCodec.
+
+    Encodes are keyed by a hash of the payload and the encode parameters,
+    decodes by a hash of the image file. Unseeded encodes are random and
+    bypass the cache. See _TieredCache for the two tiers.
+    """
+
+    def encode_bytes(
+        self,
+        data: bytes,
+        output_path: str | Path,
+        *,
+        random_seed: int | None = None,
+        format_version: int = PNGBytesCodec.FORMAT_LEGACY,
+    ) -> None:
+        """
+        Encode bytes as a PNG image, reusing a cached image when possible.
+
+        Args:
+            data: Raw bytes to encode
+            output_path: Where to save the PNG file
+            random_seed: Seed for reproducible output (None bypasses the cache)
+            format_version: FORMAT_LEGACY or FORMAT_DENSE
+        """
+        if random_seed is None:
+            self.codec.encode_bytes(data, output_path, format_version=format_version)
+            return
+
+        # the walk's step rules change the pixels and the writer settings
+        # the PNG bytes
+        params = {
+            "seed": random_seed,
+            "format": format_version,
+            "max_distance": self.codec.MAX_DISTANCE,
+            "directions": self.codec._DIRECTIONS,
+            "compress_level": self.codec.PNG_COMPRESS_LEVEL,
+            "band_bytes": self.codec.PNG_BAND_BYTES,
+        }
+        key = self._key("encode", params, data)
+        png = self._get(key)
+        if png is not None:
+            Path(output_path).write_bytes(png)
+            return
+
+        self.codec.encode_bytes(
+            data, output_path,
+            random_seed=random_seed, format_version=format_version,
+        )
+        self._put(key, Path(output_path).read_bytes())
+
+    def encode_file(
+        self,
+        input_path: str | Path,
+        output_path: str | Path,
+        **kwargs,
+    ) -> None:
+        """Encode a file as a PNG image; see encode_bytes() for options."""
+        with open(input_path, 'rb') as f:
+            data = f.read()
+
+        self.encode_bytes(data, output_path, **kwargs)
+
+    def encode_text(self, text: str, output_path: str | Path, **kwargs) -> None:
+        """Encode text as a PNG image; see encode_bytes() for options."""
+        data = text.encode("utf-8", "surrogatepass")
+        self.encode_bytes(data, output_path, **kwargs)
+
+    def decode_bytes(self, image_path: str | Path) -> bytes:
+        """
+        Decode bytes from a PNG image, reusing a cached result when possible.
+
+        Args:
+            image_path: Path to the encoded PNG file
+
+        Returns:
+            The original bytes data
+        """
+        png = Path(image_path).read_bytes()
+        key = self._key("decode", {}, png)
+        data = self._get(key)
+        if data is None:
+            data = self.codec.decode_bytes(io.BytesIO(png))
+            self._put(key, data)
+        return data
+
+    def decode_to_file(self, image_path: str | Path, output_path: str | Path) -> None:
+        """Decode bytes from PNG image and save to file."""
+        data = self.decode_bytes(image_path)
+        with open(output_path, 'wb') as f:
+            f.write(data)
+
+    def decode_text(self, image_path: str | Path) -> str:
+        """Decode text from a PNG image."""
+        return self.decode_bytes(image_path).decode("utf-8", "surrogatepass")
+
+
+class LayoutCache(_TieredCache):
+    """
+    Cache of seeded walk layouts for PNGBytesCodec.encode_with_layout().
+
+    Encoding many same-length records with one seed walks the same path
+    every time. LayoutCache keeps that walk, keyed by seed, pixel count and
+    format, so each record only pays for scattering its bytes into canvas
+    and scanline buffers reused per thread. Output is identical to
+    codec.encode_bytes(). Unseeded encodes bypass the cache.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path | None = None,
+        *,
+        memory_items: int = 16,
+        disk_bytes: int = 1 << 30,
+        codec=PNGBytesCodec,
+    ) -> None:
+        """
+        Args:
+            cache_dir: Directory of the on-disk tier (None for memory only)
+            memory_items: Maximum number of layouts kept in memory
+            disk_bytes: Size cap of the on-disk tier
+            codec: Codec class whose walks are cached
+        """
+        super().__init__(
+            cache_dir, memory_items=memory_items, disk_bytes=disk_bytes, codec=codec
+        )
+        self._local = threading.local()
+
+    def layout(
+        self,
+        length: int,
+        *,
+        random_seed: int,
+        format_version: int = PNGBytesCodec.FORMAT_LEGACY,
+    ) -> WalkLayout:
+        """
+        Return the walk layout for payloads of ``length`` bytes.
+
+        Args:
+            length: Payload length in bytes
+            random_seed: Seed the walk uses
+            format_version: FORMAT_LEGACY or FORMAT_DENSE
+
+        Raises:
+            ValueError: If the format is unknown or a legacy payload is empty
+        """
+        codec = self.codec
+        if format_version not in codec._FORMATS:
+            raise ValueError(f"Unsupported format version: {format_version}")
+        if format_version == codec.FORMAT_LEGACY and not length:
+            raise ValueError("Cannot encode empty data in the legacy format")
+        pixel_count = codec._pixel_count(length, format_version)
+
+        # the walk also depends on the codec's step rules
+        params = {
+            "seed": random_seed,
+            "pixels": pixel_count,
+            "format": format_version,
+            "max_distance": codec.MAX_DISTANCE,
+            "directions": codec._DIRECTIONS,
+        }
+        key = self._key("layout", params, b"")
+        layout = self._get(key)
+        if layout is None:
+            layout = codec.walk_layout(
+                pixel_count, random_seed=random_seed, format_version=format_version
+            )
+            self._put(key, layout)
+        return layout
+
+    def encode_bytes(
+        self,
+        data: bytes,
+        output_path: str | Path,
+        *,
+        random_seed: int | None = None,
+        format_version: int = PNGBytesCodec.FORMAT_LEGACY,
+    ) -> None:
+        """
+        Encode bytes as a PNG image along a cached walk layout.
+
+        Args:
+            data: Raw bytes to encode
+            output_path: Where to save the PNG file
+            random_seed: Seed for reproducible output (None bypasses the cache)
+            format_version: FORMAT_LEGACY or FORMAT_DENSE
+        """
+        if random_seed is None:
+            self.codec.encode_bytes(data, output_path, format_version=format_version)
+            return
+
+        layout = self.layout(
+            len(data), random_seed=random_seed, format_version=format_version
+        )
+        self.codec.encode_with_layout(data, layout, output_path, scratch=self.scratch)
+
+    @property
+    def scratch(self) -> ScratchArena:
+        """The calling thread's arena for canvas and scanline buffers."""
+        scratch = getattr(self._local, "scratch", None)
+        if scratch is None:
+            scratch = self._local.scratch = ScratchArena()
+        return scratch
+
+    def encode_file(
+        self,
+        input_path: str | Path,
+        output_path: str | Path,
+        **kwargs,
+    ) -> None:
+        """Encode a file as a PNG image; see encode_bytes() for options."""
+        with open(input_path, 'rb') as f:
+            data = f.read()
+
+        self.encode_bytes(data, output_path, **kwargs)
+
+    def encode_text(self, text: str, output_path: str | Path, **kwargs) -> None:
+        """Encode text as a PNG image; see encode_bytes() for options."""
+        data = text.encode("utf-8", "surrogatepass")
+        self.encode_bytes(data, output_path, **kwargs)
+
+    def _dump(self, layout: WalkLayout) -> bytes:
+        buffer = io.BytesIO()
+        meta = np.array(
+            [layout.width, layout.height, layout.format_version], dtype=np.int64
+        )
+        np.savez(buffer, offsets=layout.offsets, pointers=layout.pointers, meta=meta)
+        return buffer.getvalue()
+
+    def _load(self, raw: bytes) -> WalkLayout:
+        with np.load(io.BytesIO(raw)) as arrays:
+            width, height, format_version = (int(v) for v in arrays["meta"])
+            return self.codec._make_layout(
+                format_version, width, height, arrays["offsets"], arrays["pointers"]
+            )
@@ -0,0 +1,75 @@
+"""
+Command-line tools for ByteArt.
+
+    python cli.py plan LENGTH [--seed N] [--dense] [--max-pixels N] [--max-memory BYTES]
+"""
+
+import argparse
+import sys
+
+from codec import PNGBytesCodec, WalkDeadEndError
+
+
+def plan_command(args) -> int:
+    """Print the predicted encode of a payload and apply admission limits."""
+    format_version = (
+        PNGBytesCodec.FORMAT_DENSE if args.dense else PNGBytesCodec.FORMAT_LEGACY
+    )
+    try:
+        plan = PNGBytesCodec.plan(
+            args.length,
+            random_seed=args.seed,
+            format_version=format_version,
+            max_canvas_pixels=args.max_pixels,
+        )
+    except WalkDeadEndError as exc:
+        print(f"Rejected: {exc}", file=sys.stderr)
+        return 1
+
+    print(f"Payload:        {plan.length} bytes")
+    print(f"Pixels:         {plan.pixel_count}")
+    if not plan.exact:
+        print("Geometry:       95th percentile estimate (pass --seed for the exact walk)")
+    elif not plan.complete:
+        print("Geometry:       walk stopped at --max-pixels, canvas is a lower bound")
+    print(f"Bounding box:   ({plan.min_x}, {plan.min_y}) - ({plan.max_x}, {plan.max_y})")
+    print(f"Canvas:         {plan.width} x {plan.height}")
+    if plan.complete:
+        print(f"Fill ratio:     {plan.fill_ratio:.3f}")
+    print(f"Peak memory:    ~{plan.peak_memory / 2 ** 20:.1f} MB")
+    print(f"Estimated time: ~{plan.estimated_seconds:.2f} s")
+
+    rejected = False
+    if args.max_pixels is not None and plan.canvas_pixels > args.max_pixels:
+        print(f"Rejected: canvas exceeds {args.max_pixels} pixels", file=sys.stderr)
+        rejected = True
+    if args.max_memory is not None and plan.peak_memory > args.max_memory:
+        print(f"Rejected: memory exceeds {args.max_memory} bytes", file=sys.stderr)
+        rejected = True
+    return 1 if rejected else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="byteart")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = commands.add_parser(
+        "plan", help="predict canvas size, memory and time of an encode"
+    )
+    plan_parser.add_argument("length", type=int, help="payload size in bytes")
+    plan_parser.add_argument("--seed", type=int, default=None, help="random seed")
+    plan_parser.add_argument("--dense", action="store_true", help="use the dense format")
+    plan_parser.add_argument("--max-pixels", type=int, help="reject larger canvases")
+    plan_parser.add_argument("--max-memory", type=int, help="reject higher peak memory (bytes)")
+    plan_parser.set_defaults(handler=plan_command)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,13 +7,163 @@ by encoding bytes as pixel data with spatial relationships indicated by color ch
 
 from __future__ import annotations
 
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
 import random
-from typing import List, Tuple
+import struct
+import tempfile
+import time
+import zlib
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple
 
 from pathlib import Path
+import numpy as np
 from PIL import Image
 
 
+class DecodeError(ValueError):
+    """An image cannot be decoded: no payload, bad metadata or bad chain."""
+
+
+class BrokenChainError(DecodeError):
+    """The pixel chain has a dangling pointer or no unique start."""
+
+
+class PointerCycleError(BrokenChainError):
+    """The pixel chain loops back onto a pixel it already visited."""
+
+
+class DecodeLimitError(DecodeError):
+    """Decoding would exceed a configured resource limit."""
+
+
+class CanvasTooLargeError(DecodeLimitError):
+    """The canvas has more pixels than allowed."""
+
+
+class OutputTooLargeError(DecodeLimitError):
+    """The payload would be larger than allowed."""
+
+
+class DecodeTimeoutError(DecodeLimitError):
+    """Decoding ran past its time budget."""
+
+
+class WalkDeadEndError(RuntimeError):
+    """The walk has no free position within MAX_DISTANCE of its pixel."""
+
+
+class ScratchArena:
+    """
+    Named, growable NumPy buffers reused between calls.
+    
+    take() hands out a view of the requested shape over a buffer that is
+    only reallocated, at twice its size, when it is too small.
+    """
+
+    def __init__(self) -> None:
+        self._buffers: dict = {}
+        self.allocations = 0
+
+    def take(
+        self,
+        name: str,
+        shape: Tuple[int, ...],
+        dtype=np.uint8,
+        *,
+        zero: bool = False,
+    ) -> np.ndarray:
+        """Return a ``shape`` view of the ``name`` buffer, growing it if needed."""
+        dtype = np.dtype(dtype)
+        size = math.prod(shape) * dtype.itemsize
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.nbytes < size:
+            capacity = max(size, 2 * buffer.nbytes if buffer is not None else 0)
+            buffer = np.empty(capacity, dtype=np.uint8)
+            self._buffers[name] = buffer
+            self.allocations += 1
+        view = buffer[:size].view(dtype).reshape(shape)
+        if zero:
+            view.fill(0)
+        return view
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def clear(self) -> None:
+        """Release every buffer."""
+        self._buffers.clear()
+
+
+@dataclass(frozen=True)
+class EncodingPlan:
+    """Predicted geometry and cost of an encode, see PNGBytesCodec.plan()."""
+
+    length: int
+    pixel_count: int
+    min_x: int
+    min_y: int
+    max_x: int
+    max_y: int
+    peak_memory: int        # bytes
+    estimated_seconds: float
+    exact: bool = True      # geometry of the seeded walk, not the model
+    complete: bool = True   # False if the walk stopped at max_canvas_pixels
+
+    @property
+    def width(self) -> int:
+        return self.max_x - self.min_x + 1 if self.pixel_count else 0
+
+    @property
+    def height(self) -> int:
+        return self.max_y - self.min_y + 1 if self.pixel_count else 0
+
+    @property
+    def canvas_pixels(self) -> int:
+        return self.width * self.height
+
+    @property
+    def fill_ratio(self) -> float:
+        return self.pixel_count / self.canvas_pixels if self.pixel_count else 0.0
+
+
+@dataclass(frozen=True, eq=False)
+class WalkLayout:
+    """
+    Pixel positions and pointers of one seeded walk, see
+    PNGBytesCodec.walk_layout(). They depend only on the seed, the pixel
+    count and the format, never on the payload bytes.
+    
+    ``offsets`` are flat canvas offsets (y * width + x) in walk order;
+    ``template`` is the canvas with the pointer and alpha channels drawn
+    and the data channels left zero.
+    """
+
+    format_version: int
+    width: int
+    height: int
+    offsets: np.ndarray
+    pointers: np.ndarray
+    template: np.ndarray
+
+    @property
+    def pixel_count(self) -> int:
+        return self.offsets.size
+
+
 class PNGBytesCodec:
     """
     A codec for encoding/decoding bytes to/from PNG images.
@@ -24,6 +174,12 @@ class PNGBytesCodec:
     3. Using the green channel to encode distance+direction to next pixel
        (bits 7-2 = distance, bits 1-0 = direction)
     4. Creating a chain of pixels that can be followed to reconstruct the data
+
+    The dense format (``format_version=FORMAT_DENSE``) stores three bytes per
+    pixel in R, G and B and moves the pointer into the alpha channel, so any
+    non-zero alpha still marks an occupied pixel. Dense images carry their
+    format version and exact payload length in PNG text chunks; images
+    without them are decoded as the legacy format.
     """
     
     # direction encoding constants
@@ -43,7 +199,86 @@ class PNGBytesCodec:
     
     _DIRECTIONS = list(_DIR_BITS.keys())
 
+    # _DIRS_DECODE as lookup arrays indexed by direction code
+    _DIR_DX = np.array([1, -1, 0, 0])
+    _DIR_DY = np.array([0, 0, 1, -1])
+
     MAX_DISTANCE = 2 ** 6 - 1
+    _WALK_CHUNK = 1 << 16  # walk rows converted per np.fromiter() into a buffer
+
+    # format versions
+    FORMAT_LEGACY = 1   # R/B data, G pointer, alpha = occupancy
+    FORMAT_DENSE = 2    # R/G/B data, alpha pointer
+
+    # version -> (data channels, pointer channel)
+    _FORMATS = {
+        FORMAT_LEGACY: ((0, 2), 1),
+        FORMAT_DENSE: ((0, 1, 2), 3),
+    }
+
+    # dense EOF marker: distance 0 with a non-zero alpha
+    _DENSE_EOF = 0b01
+
+    # PNG text chunk keys
+    _META_PREFIX = "byteart:"
+
+    # special image kinds, marked by a metadata key -> (name, reader)
+    _IMAGE_KINDS = {
+        "atlas": ("an atlas", "open_atlas()"),
+        "delta": ("a delta", "decode_delta()"),
+    }
+
+    # binary atlas index in a private, unsafe-to-copy chunk, zlib-compressed:
+    # header, one row per entry, then the UTF-8 keys back to back
+    _ATLAS_INDEX_CHUNK = b"baIX"
+    _ATLAS_INDEX_VERSION = 2        # byteart:atlas value; 1 was a JSON index
+    _ATLAS_INDEX_HEADER = struct.Struct("<I")   # entry count
+    _ATLAS_INDEX_ROW = np.dtype(
+        [("key", "<u4"), ("x", "<u4"), ("y", "<u4"), ("length", "<u4")]
+    )
+    MAX_ATLAS_INDEX_BYTES = 256 << 20   # decompressed, refused beyond this
+
+    # PNG writer
+    PNG_COMPRESS_LEVEL = 6
+    PNG_BAND_BYTES = 256 << 10  # uncompressed bytes per deflate band
+    PNG_WORKERS = None          # compression threads (None for the default)
+    _PNG_ZTXT_THRESHOLD = 1024  # longer text chunks are compressed
+
+    # cost model of encode_bytes() used by plan(), measured on CPython 3.13
+    _PLAN_CANVAS_PER_PIXEL_P95 = 5.6      # walk bbox, 95th percentile (mean 3.5)
+    _PLAN_WALK_SECONDS_PER_PIXEL = 4e-6
+    _PLAN_BYTES_PER_PIXEL = 176           # occupancy set, walk and RGBA rows
+    _PLAN_BYTES_PER_CANVAS_PIXEL = 2      # canvas and scanlines, past the walk peak
+    _PLAN_SECONDS_PER_PIXEL = 1e-7        # layout, on top of the walk
+    _PLAN_SECONDS_PER_CANVAS_PIXEL = 1e-7 # rasterize and deflate
+
+    # seed search used by encode_*(optimize=True)
+    OPTIMIZE_SEEDS = 8
+    OPTIMIZE_TIME_BUDGET = None     # seconds, None waits for every seed
+    OPTIMIZE_METRIC = "area"        # or "compressed"
+    _OPTIMIZE_METRICS = ("area", "compressed")
+
+    # worker processes (seed search, shards) start from a clean server
+    # process rather than a fork of a possibly multi-threaded parent
+    PROCESS_START_METHOD = (
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+
+    # delta encoding: content-defined chunking with a rolling hash
+    DELTA_AVG_CHUNK = 4096      # power of two
+    DELTA_MIN_CHUNK = 1024
+    DELTA_MAX_CHUNK = 16384
+    _DELTA_WINDOW = 16
+    _DELTA_GEAR = np.random.default_rng(0x62797465).integers(
+        0, 2 ** 32, 256, dtype=np.uint32
+    )
+    _DELTA_COPY = 0
+    _DELTA_INSERT = 1
+
+    # sharded output
+    SHARD_SIZE = 1 << 20  # payload bytes per shard
+    MANIFEST_NAME = "manifest.json"
+    _MANIFEST_VERSION = 1
 
     @classmethod
     def encode_bytes(
@@ -52,6 +287,11 @@ class PNGBytesCodec:
         output_path: str | Path,
         *,
         random_seed: int | None = None,
+        format_version: int = FORMAT_LEGACY,
+        optimize: bool = False,
+        optimize_seeds: int | None = None,
+        optimize_time_budget: float | None = None,
+        optimize_metric: str | None = None,
     ) -> None:
         """
         Encode bytes as a PNG image.
@@ -60,20 +300,28 @@ class PNGBytesCodec:
             data: Raw bytes to encode
             output_path: Where to save the PNG file
             random_seed: Seed for reproducible output (None for random)
+            format_version: FORMAT_LEGACY or FORMAT_DENSE
+            optimize: Search OPTIMIZE_SEEDS seeds from ``random_seed`` on
+                for the smallest output (see search_seed()) and record the
+                winner in the image
+            optimize_seeds: Candidates to search (default OPTIMIZE_SEEDS)
+            optimize_time_budget: Search time budget in seconds (default
+                OPTIMIZE_TIME_BUDGET)
+            optimize_metric: "area" or "compressed" (default OPTIMIZE_METRIC)
         """
+        metadata = None
+        if optimize:
+            random_seed = cls.search_seed(
+                data,
+                seeds=optimize_seeds,
+                time_budget=optimize_time_budget,
+                metric=optimize_metric,
+                random_seed=random_seed,
+                format_version=format_version,
+            )
+            metadata = {"seed": random_seed}
         rng = random.Random(random_seed) if random_seed is not None else random
-        
-        byte_seq = data
-        if len(byte_seq) % 2:
-            byte_seq += b"\x00"
-        
-        byte_pairs = [
-            (byte_seq[i], byte_seq[i + 1]) 
-            for i in range(0, len(byte_seq), 2)
-        ]
-        
-        pixels = cls._encode_pixels(byte_pairs, rng)
-        cls._save_image(pixels, output_path)
+        cls._encode_to_png(data, output_path, rng, format_version, metadata=metadata)
 
     @classmethod
     def encode_file(
@@ -82,6 +330,11 @@ class PNGBytesCodec:
         output_path: str | Path,
         *,
         random_seed: int | None = None,
+        format_version: int = FORMAT_LEGACY,
+        optimize: bool = False,
+        optimize_seeds: int | None = None,
+        optimize_time_budget: float | None = None,
+        optimize_metric: str | None = None,
     ) -> None:
         """
         Encode a file as a PNG image.
@@ -90,11 +343,21 @@ class PNGBytesCodec:
             input_path: Path to the file to encode
             output_path: Where to save the PNG file
             random_seed: Seed for reproducible output (None for random)
+            format_version: FORMAT_LEGACY or FORMAT_DENSE
+            optimize: Search seeds for the smallest output
+            optimize_seeds: Candidates to search (default OPTIMIZE_SEEDS)
+            optimize_time_budget: Search time budget in seconds
+            optimize_metric: "area" or "compressed"
         """
         with open(input_path, 'rb') as f:
             data = f.read()
         
-        cls.encode_bytes(data, output_path, random_seed=random_seed)
+        cls.encode_bytes(
+            data, output_path,
+            random_seed=random_seed, format_version=format_version,
+            optimize=optimize, optimize_seeds=optimize_seeds,
+            optimize_time_budget=optimize_time_budget, optimize_metric=optimize_metric,
+        )
 
     @classmethod
     def encode_text(
@@ -103,6 +366,11 @@ class PNGBytesCodec:
         output_path: str | Path,
         *,
         random_seed: int | None = None,
+        format_version: int = FORMAT_LEGACY,
+        optimize: bool = False,
+        optimize_seeds: int | None = None,
+        optimize_time_budget: float | None = None,
+        optimize_metric: str | None = None,
     ) -> None:
         """
         Encode text as a PNG image (for backward compatibility).
@@ -111,40 +379,63 @@ class PNGBytesCodec:
             text: Unicode string to encode (supports emojis & non-BMP chars)
             output_path: Where to save the PNG file
             random_seed: Seed for reproducible output (None for random)
+            format_version: FORMAT_LEGACY or FORMAT_DENSE
+            optimize: Search seeds for the smallest output
+            optimize_seeds: Candidates to search (default OPTIMIZE_SEEDS)
+            optimize_time_budget: Search time budget in seconds
+            optimize_metric: "area" or "compressed"
         """
         # text to UTF-8 bytes
         data = text.encode("utf-8", "surrogatepass")
-        cls.encode_bytes(data, output_path, random_seed=random_seed)
+        cls.encode_bytes(
+            data, output_path,
+            random_seed=random_seed, format_version=format_version,
+            optimize=optimize, optimize_seeds=optimize_seeds,
+            optimize_time_budget=optimize_time_budget, optimize_metric=optimize_metric,
+        )
     
     @classmethod
-    def decode_bytes(cls, image_path: str | Path) -> bytes:
+    def decode_bytes(
+        cls,
+        image_path: str | Path,
+        *,
+        max_canvas_pixels: int | None = None,
+        max_output_bytes: int | None = None,
+        time_budget: float | None = None,
+    ) -> bytes:
         """
         Decode bytes from a PNG image created by encode_bytes().
         
+        The limits guard against untrusted images and are checked as early
+        as possible: the canvas size before any pixel is loaded, the output
+        size before the chain is followed.
+        
         Args:
             image_path: Path to the encoded PNG file
+            max_canvas_pixels: Reject larger images before loading them
+            max_output_bytes: Reject images whose chain could hold more
+                bytes (every opaque pixel's data channels, so the last
+                pixel's padding counts) or recording a longer payload
+            time_budget: Give up after this many seconds
             
         Returns:
             The original bytes data
             
         Raises:
-            ValueError: If image has no payload or broken pixel chain
+            DecodeLimitError: If a limit is exceeded (CanvasTooLargeError,
+                OutputTooLargeError or DecodeTimeoutError)
+            BrokenChainError: If the pixel chain is broken or loops
+                (PointerCycleError)
+            DecodeError: If the image has no payload or an unsupported
+                format version
         """
-        # load non-transparent pixels
-        pixel_data = cls._load_pixel_data(image_path)
-        
-        if not pixel_data:
-            raise ValueError("No payload found in the image")
-            
-        # find starting pixel and walk the chain
-        start_pixel = cls._find_start_pixel(pixel_data)
-        byte_sequence = cls._extract_bytes(pixel_data, start_pixel)
-        
-        # convert bytes back to original data
-        data = bytes(byte_sequence)
-        
-        #  remove any trailing null padding
-        return data.rstrip(b"\x00")
+        data, _ = cls._decode_payload(
+            image_path,
+            max_canvas_pixels=max_canvas_pixels,
+            max_output_bytes=max_output_bytes,
+            time_budget=time_budget,
+        )
+        return data
 
     @classmethod
     def decode_to_file(
@@ -176,149 +467,2125 @@ class PNGBytesCodec:
         """
         data = cls.decode_bytes(image_path)
         return data.decode("utf-8", "surrogatepass")
-    
+
     @classmethod
-    def _encode_pixels(
-        cls, 
-        byte_pairs: List[Tuple[int, int]], 
-        rng
-    ) -> List[Tuple[int, int, int, int, int]]:  # (x, y, r, g, b)
-        """Generate pixel data for byte pairs."""
-        pixels = []
-        used_positions = {(0, 0)}
-        current_x = current_y = 0
+    def encode_array(
+        cls,
+        array: np.ndarray,
+        output_path: str | Path,
+        *,
+        random_seed: int | None = None,
+        format_version: int = FORMAT_DENSE,
+    ) -> None:
+        """
+        Encode a NumPy array with its dtype, shape and memory order.
         
-        for idx, (high_byte, low_byte) in enumerate(byte_pairs):
-            # determine green value (pointer to next pixel or EOF)
-            if idx < len(byte_pairs) - 1:
-                # find next available position
-                next_x, next_y, green = cls._find_next_position(
-                    current_x, current_y, used_positions, rng
-                )
-                used_positions.add((next_x, next_y))
-            else:
-                # last pixel - EOF sentinel
-                green = 0
-                next_x = next_y = None
+        The array's memory is read in place through a byte view; only
+        arrays that are neither C- nor Fortran-contiguous are copied. The
+        header is stored in a ``byteart:array`` text chunk in the form of
+        an .npy header (dtype descr with byte order, shape, order).
+        
+        Args:
+            array: Array to encode (no Python object dtypes)
+            output_path: Where to save the PNG file
+            random_seed: Seed for reproducible output (None for random)
+            format_version: FORMAT_DENSE or FORMAT_LEGACY
+        """
+        array = np.asarray(array)
+        if array.dtype.hasobject:
+            raise ValueError("Arrays of Python objects cannot be encoded")
+        fortran = array.flags.f_contiguous and not array.flags.c_contiguous
+        if not (fortran or array.flags.c_contiguous):
+            array = np.ascontiguousarray(array)
+        
+        header = {
+            "descr": np.lib.format.dtype_to_descr(array.dtype),
+            "fortran_order": fortran,
+            "shape": list(array.shape),
+        }
+        rng = random.Random(random_seed) if random_seed is not None else random
+        cls._encode_to_png(
+            memoryview(cls._byte_view(array, fortran)), output_path, rng, format_version,
+            metadata={"array": json.dumps(header, separators=(",", ":"))},
+        )
+
+    @classmethod
+    def decode_array(
+        cls,
+        image_path: str | Path,
+        *,
+        out: np.ndarray | None = None,
+        writable: bool = True,
+        mmap_path: str | Path | None = None,
+        max_canvas_pixels: int | None = None,
+        max_output_bytes: int | None = None,
+        time_budget: float | None = None,
+    ) -> np.ndarray:
+        """
+        Decode an array written by encode_array().
+        
+        The payload is scattered straight from the pixels into the
+        destination's memory: ``out`` when given, else a new .npy file at
+        ``mmap_path`` opened as a memory map, else a new array.
+        
+        Args:
+            image_path: Path to the encoded PNG file
+            out: Array of the recorded dtype, shape and order to fill
+            writable: Return a writable array (ignored with ``out``)
+            mmap_path: Decode into a memory-mapped .npy file at this path
+            max_canvas_pixels: See decode_bytes()
+            max_output_bytes: See decode_bytes()
+            time_budget: See decode_bytes()
             
-            pixels.append((current_x, current_y, high_byte, green, low_byte))
+        Returns:
+            The decoded array
             
-            if next_x is not None:
-                current_x, current_y = next_x, next_y
-                
-        return pixels
-    
-    @classmethod
-    def _find_next_position(
-        cls, x: int, y: int, used: set, rng
-    ) -> Tuple[int, int, int]:
-        """Find next available position and return coordinates + green value."""
-        directions = list(cls._DIRECTIONS)  # copy the directions list
+        Raises:
+            DecodeError: If the image holds no array or its header is invalid
+                or disagrees with the recorded payload length
+            DecodeLimitError: If a limit is exceeded, see decode_bytes()
+            ValueError: If ``out`` does not match the recorded array
+        """
+        if out is not None and mmap_path is not None:
+            raise ValueError("Pass either out or mmap_path, not both")
+        decoded = []
         
-        while directions:
-            dx, dy = rng.choice(directions)
-            directions.remove((dx, dy))  # remove this direction to avoid retrying
+        def allocate(metadata: dict) -> np.ndarray:
+            if "array" not in metadata:
+                raise DecodeError("Image is not an array")
+            try:
+                header = json.loads(metadata["array"])
+                dtype = np.lib.format.descr_to_dtype(header["descr"])
+                shape = tuple(int(n) for n in header["shape"])
+                fortran = bool(header["fortran_order"])
+            except (ValueError, TypeError, KeyError) as error:
+                raise DecodeError(f"Invalid array header: {error}") from None
+            if dtype.hasobject:
+                raise DecodeError("Invalid array header: object dtype")
+            if any(n < 0 for n in shape):
+                raise DecodeError(f"Invalid array header: negative shape {shape}")
             
-            for distance in range(1, cls.MAX_DISTANCE + 1):
-                next_x, next_y = x + dx * distance, y + dy * distance
-                if (next_x, next_y) not in used:
-                    direction_code = cls._DIR_BITS[(dx, dy)]
-                    green = (distance << 2) | direction_code
-                    return next_x, next_y, green
+            # the header is untrusted: size it against the checked length
+            # before any memory or file is allocated
+            nbytes = math.prod(shape) * dtype.itemsize
+            length = cls._payload_length(metadata)
+            if nbytes != length:
+                raise DecodeError(
+                    f"Array header of {nbytes} bytes does not match "
+                    f"the recorded payload length ({length})"
+                )
+            
+            if out is not None:
+                contiguous = out.flags.f_contiguous if fortran else out.flags.c_contiguous
+                if out.shape != shape or out.dtype != dtype or not contiguous:
+                    raise ValueError(
+                        f"out must be a {'Fortran' if fortran else 'C'}-contiguous "
+                        f"{dtype} array of shape {shape}"
+                    )
+                array = out
+            elif mmap_path is not None:
+                array = np.lib.format.open_memmap(
+                    mmap_path, mode="w+", dtype=dtype, shape=shape, fortran_order=fortran
+                )
+            else:
+                array = np.empty(shape, dtype=dtype, order="F" if fortran else "C")
+            decoded.append(array)
+            return cls._byte_view(array, fortran)
         
-        # all directions at all distances are blocked
-        raise RuntimeError("No available positions found within max_dist")
-    
+        try:
+            cls._decode_payload(
+                image_path,
+                into=allocate,
+                max_canvas_pixels=max_canvas_pixels,
+                max_output_bytes=max_output_bytes,
+                time_budget=time_budget,
+            )
+        except BaseException:
+            # never leave a partially decoded .npy file behind
+            if mmap_path is not None and decoded:
+                decoded.clear()
+                Path(mmap_path).unlink(missing_ok=True)
+            raise
+        array = decoded[0]
+        if out is not None:
+            return array
+        if mmap_path is not None:
+            array.flush()
+            del array, decoded[0]
+            return np.load(mmap_path, mmap_mode="r+" if writable else "r")
+        array.flags.writeable = writable
+        return array
+
+    @staticmethod
+    def _byte_view(array: np.ndarray, fortran: bool) -> np.ndarray:
+        """Flat uint8 view of a contiguous array's memory, in storage order."""
+        return (array.T if fortran else array).reshape(-1).view(np.uint8)
+
     @classmethod
-    def _save_image(
-        cls, 
-        pixels: List[Tuple[int, int, int, int, int]], 
-        output_path: str | Path
+    def encode_delta(
+        cls,
+        base_image_path: str | Path,
+        data: bytes,
+        output_path: str | Path,
+        *,
+        random_seed: int | None = None,
+        format_version: int = FORMAT_DENSE,
     ) -> None:
-        """Create and save the PNG image from pixel data."""
-        # calculate canvas bounds
-        min_x = min(p[0] for p in pixels)
-        max_x = max(p[0] for p in pixels)
-        min_y = min(p[1] for p in pixels)
-        max_y = max(p[1] for p in pixels)
-        
-        width = max_x - min_x + 1
-        height = max_y - min_y + 1
-        
-        # create transparent canvas
-        canvas = [[(0, 0, 0, 0) for _ in range(width)] for _ in range(height)]
-        
-        # place pixels
-        for x, y, r, g, b in pixels:
-            canvas_x, canvas_y = x - min_x, y - min_y
-            canvas[canvas_y][canvas_x] = (r, g, b, 255)  # opaque
-        
-        # save 
-        img = Image.new("RGBA", (width, height))
-        img.putdata([pixel for row in canvas for pixel in row])
-        img.save(Path(output_path))
-    
-    @classmethod
-    def _load_pixel_data(cls, image_path: str | Path) -> dict:
-        """Load non-transparent pixels from image."""
-        img = Image.open(image_path).convert("RGBA")
-        width, height = img.size
-        pixels = img.load()
-        
-        data = {}
-        for y in range(height):
-            for x in range(width):
-                r, g, b, alpha = pixels[x, y]
-                if alpha:  # non-transparent pixel
-                    data[(x, y)] = (r, g, b)
-                    
-        return data
-    
+        """
+        Encode a new version of a payload as a delta against a base image.
+        
+        Both payloads are split into content-defined chunks with a rolling
+        hash. Chunks also found in the base become copy references, only
+        the rest is stored, so small edits cost a small image.
+        
+        Args:
+            base_image_path: Encoded PNG holding the previous version
+            data: Raw bytes of the new version
+            output_path: Where to save the delta PNG
+            random_seed: Seed for reproducible output (None for random)
+            format_version: FORMAT_DENSE or FORMAT_LEGACY
+        """
+        base = cls.decode_bytes(base_image_path)
+
+        base_chunks = {}
+        offset = 0
+        for end in cls._chunk_boundaries(base):
+            base_chunks.setdefault(hashlib.sha256(base[offset:end]).digest(), offset)
+            offset = end
+
+        # copy/insert operations, merging neighbours where possible
+        operations = []
+        offset = 0
+        for end in cls._chunk_boundaries(data):
+            chunk = data[offset:end]
+            source = base_chunks.get(hashlib.sha256(chunk).digest())
+            last = operations[-1] if operations else None
+            if source is not None:
+                if last and last[0] == cls._DELTA_COPY and last[1] + last[2] == source:
+                    last[2] += len(chunk)
+                else:
+                    operations.append([cls._DELTA_COPY, source, len(chunk)])
+            elif last and last[0] == cls._DELTA_INSERT:
+                last[1] += chunk
+            else:
+                operations.append([cls._DELTA_INSERT, bytearray(chunk)])
+            offset = end
+
+        stream = bytearray()
+        for operation in operations:
+            stream.append(operation[0])
+            if operation[0] == cls._DELTA_COPY:
+                stream += cls._varint(operation[1]) + cls._varint(operation[2])
+            else:
+                stream += cls._varint(len(operation[1])) + operation[1]
+
+        header = {
+            "base_length": len(base),
+            "base_sha256": hashlib.sha256(base).hexdigest(),
+            "length": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        }
+        rng = random.Random(random_seed) if random_seed is not None else random
+        cls._encode_to_png(
+            bytes(stream), output_path, rng, format_version,
+            metadata={"delta": json.dumps(header, separators=(",", ":"))},
+        )
+
     @classmethod
-    def _find_start_pixel(cls, pixel_data: dict) -> Tuple[int, int]:
-        """Find the starting pixel (not pointed to by any other pixel)."""
-        pointed_to = set()
+    def decode_delta(
+        cls,
+        base_image_path: str | Path,
+        delta_image_path: str | Path,
+    ) -> bytes:
+        """
+        Rebuild the payload of a delta image from its base image.
         
-        for (x, y), (_, g, _) in pixel_data.items():
-            if g == 0:  # EOF sentinel
-                continue
-                
-            distance = g >> 2
-            direction_code = g & 0x03
-            dx, dy = cls._DIRS_DECODE[direction_code]
-            target = (x + dx * distance, y + dy * distance)
-            pointed_to.add(target)
+        Args:
+            base_image_path: Encoded PNG the delta was made against
+            delta_image_path: Delta PNG written by encode_delta()
+            
+        Returns:
+            The new version's bytes
+            
+        Raises:
+            ValueError: If the base does not match or the delta is corrupt
+        """
+        output = bytearray()
+        cls._apply_delta(base_image_path, delta_image_path, output.extend)
+        return bytes(output)
+
+    @classmethod
+    def decode_delta_to_file(
+        cls,
+        base_image_path: str | Path,
+        delta_image_path: str | Path,
+        output_path: str | Path,
+    ) -> None:
+        """
+        Rebuild the payload of a delta image and stream it to a file.
         
-        origins = [pos for pos in pixel_data if pos not in pointed_to]
+        The patched pieces are written to a temporary file next to
+        ``output_path`` that replaces it only once the result matches the
+        delta checksum, so a corrupt delta never leaves a wrong file behind.
         
-        if len(origins) != 1:
-            raise ValueError("Cannot uniquely identify the starting pixel")
+        Args:
+            base_image_path: Encoded PNG the delta was made against
+            delta_image_path: Delta PNG written by encode_delta()
+            output_path: Where to save the decoded file
             
-        return origins[0]
-    
+        Raises:
+            ValueError: If the base does not match or the delta is corrupt
+        """
+        output_path = Path(output_path)
+        fd, tmp_name = tempfile.mkstemp(
+            dir=output_path.parent, prefix=output_path.name, suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                cls._apply_delta(base_image_path, delta_image_path, f.write)
+            os.replace(tmp_name, output_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_name)
+            except FileNotFoundError:
+                pass
+            raise
+
     @classmethod
-    def _extract_bytes(cls, pixel_data: dict, start: Tuple[int, int]) -> List[int]:
-        """Follow the pixel chain and extract byte sequence."""
-        bytes_list = []
-        current = start
+    def _apply_delta(cls, base_image_path, delta_image_path, write):
+        """
+        Patch the base payload with the delta operations, passing every
+        piece to ``write`` as it is produced, then check the result against
+        the checksum recorded in the delta.
+        
+        Only the output is streamed. The base payload is decoded into
+        memory: its checksum must be verified before any piece is trusted,
+        and copy operations reference arbitrary base offsets in any order,
+        while the pixel chain can only be read front to back.
+        """
+        stream, metadata = cls._decode_payload(delta_image_path, kind="delta")
+        header = json.loads(metadata["delta"])
+
+        base = cls.decode_bytes(base_image_path)
+        if (
+            len(base) != header["base_length"]
+            or hashlib.sha256(base).hexdigest() != header["base_sha256"]
+        ):
+            raise ValueError("Delta was made against a different base image")
+
+        base = memoryview(base)
+        digest = hashlib.sha256()
+        position = 0
+        try:
+            while position < len(stream):
+                operation = stream[position]
+                position += 1
+                if operation == cls._DELTA_COPY:
+                    source, position = cls._read_varint(stream, position)
+                    length, position = cls._read_varint(stream, position)
+                    if source + length > len(base):
+                        raise ValueError("Delta copies past the end of the base")
+                    piece = base[source:source + length]
+                elif operation == cls._DELTA_INSERT:
+                    length, position = cls._read_varint(stream, position)
+                    piece = stream[position:position + length]
+                    if len(piece) != length:
+                        raise ValueError("Delta insert runs past the end of the stream")
+                    position += length
+                else:
+                    raise ValueError(f"Unknown delta operation: {operation}")
+                digest.update(piece)
+                write(piece)
+        except IndexError:
+            raise ValueError("Truncated delta stream") from None
+
+        if digest.hexdigest() != header["sha256"]:
+            raise ValueError("Patched payload does not match the delta checksum")
+
+    @classmethod
+    def _chunk_boundaries(cls, data: bytes) -> List[int]:
+        """
+        Split ``data`` into content-defined chunks and return their ends.
         
+        A buzhash over a 16-byte window is computed for every offset in
+        one vectorized pass per window byte. Offsets whose hash has its low
+        bits clear become cut points, subject to the min/max chunk size.
+        """
+        size = len(data)
+        window = cls._DELTA_WINDOW
+        if size <= cls.DELTA_MIN_CHUNK:
+            return [size] if size else []
+
+        values = np.frombuffer(data, dtype=np.uint8)
+        hashes = np.zeros(size - window + 1, dtype=np.uint32)
+        for k in range(window):
+            rotated = (cls._DELTA_GEAR << np.uint32(k)) | (cls._DELTA_GEAR >> np.uint32((32 - k) % 32))
+            hashes ^= rotated[values[window - 1 - k:size - k]]
+        mask = np.uint32(cls.DELTA_AVG_CHUNK - 1)
+        candidates = (np.flatnonzero((hashes & mask) == 0) + window).tolist()
+
+        boundaries, last = [], 0
+        for cut in candidates:
+            if cut - last < cls.DELTA_MIN_CHUNK:
+                continue
+            while cut - last > cls.DELTA_MAX_CHUNK:
+                last += cls.DELTA_MAX_CHUNK
+                boundaries.append(last)
+            if cut - last >= cls.DELTA_MIN_CHUNK:
+                boundaries.append(cut)
+                last = cut
+        while size - last > cls.DELTA_MAX_CHUNK:
+            last += cls.DELTA_MAX_CHUNK
+            boundaries.append(last)
+        if last < size:
+            boundaries.append(size)
+        return boundaries
+
+    @staticmethod
+    def _varint(value: int) -> bytes:
+        """Encode a non-negative integer as LEB128."""
+        out = bytearray()
         while True:
-            if current not in pixel_data:
-                raise ValueError("Broken pointer chain - missing target pixel")
-                
-            r, g, b = pixel_data[current]
-            bytes_list.extend([r, b])  # high byte - low byte
+            byte = value & 0x7F
+            value >>= 7
+            if value:
+                out.append(byte | 0x80)
+            else:
+                out.append(byte)
+                return bytes(out)
+
+    @staticmethod
+    def _read_varint(stream: bytes, position: int) -> Tuple[int, int]:
+        """Decode a LEB128 integer, returning it and the next position."""
+        value = shift = 0
+        while True:
+            byte = stream[position]
+            position += 1
+            value |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return value, position
+            shift += 7
+
+    @classmethod
+    def encode_atlas(
+        cls,
+        entries: dict,
+        output_path: str | Path,
+        *,
+        random_seed: int | None = None,
+        format_version: int = FORMAT_DENSE,
+    ) -> None:
+        """
+        Pack many small payloads into one image with a key index.
+        
+        Entries are laid out as consecutive chains of one walk, each ending
+        on its own EOF pixel, so the canvas is as compact as a single encode
+        of all payloads. A binary index of key -> (x, y, length) with every
+        chain's start pixel is stored zlib-compressed in a private PNG
+        chunk, which unlike text chunks has no reader-side size cap.
+        
+        Args:
+            entries: Mapping of string keys to raw bytes
+            output_path: Where to save the PNG file
+            random_seed: Seed for reproducible output (None for random)
+            format_version: FORMAT_DENSE or FORMAT_LEGACY
             
-            if g == 0:  # EOF sentinel
-                break
-                
-            # follow pointer to next pixel
-            distance = g >> 2
-            direction_code = g & 0x03
-            dx, dy = cls._DIRS_DECODE[direction_code]
-            current = (current[0] + dx * distance, current[1] + dy * distance)
+        Raises:
+            ValueError: If there are no entries or the index would exceed
+                MAX_ATLAS_INDEX_BYTES
+        """
+        if not entries:
+            raise ValueError("An atlas needs at least one entry")
+        if format_version not in cls._FORMATS:
+            raise ValueError(f"Unsupported format version: {format_version}")
+
+        rng = random.Random(random_seed) if random_seed is not None else random
+        per_pixel = len(cls._FORMATS[format_version][0])
+
+        # pad every payload to whole pixels, at least one per entry
+        chunks, counts = [], []
+        for payload in entries.values():
+            count = max(1, -(-len(payload) // per_pixel))
+            chunks.append(payload.ljust(count * per_pixel, b"\x00"))
+            counts.append(count)
+        data = b"".join(chunks)
+
+        walk = cls._walk(sum(counts), rng)
+        min_x = min(x for x, _, _ in walk)
+        min_y = min(y for _, y, _ in walk)
+
+        rows = np.empty(len(entries), dtype=cls._ATLAS_INDEX_ROW)
+        keys = [key.encode("utf-8", "surrogatepass") for key in entries]
+        rows["key"] = [len(key) for key in keys]
+        ends, offset = set(), 0
+        for row, (payload, count) in enumerate(zip(entries.values(), counts)):
+            x, y, _ = walk[offset]
+            rows[row] = (rows["key"][row], x - min_x, y - min_y, len(payload))
+            offset += count
+            ends.add(offset - 1)
+
+        index = cls._ATLAS_INDEX_HEADER.pack(len(keys)) + rows.tobytes() + b"".join(keys)
+        if len(index) > cls.MAX_ATLAS_INDEX_BYTES:
+            raise ValueError(
+                f"Atlas index of {len(index)} bytes exceeds {cls.MAX_ATLAS_INDEX_BYTES} bytes"
+            )
+
+        pixels = []
+        for i, (x, y, pointer) in enumerate(walk):
+            if i in ends:
+                pointer = 0
+            group = data[i * per_pixel:(i + 1) * per_pixel]
+            if format_version == cls.FORMAT_DENSE:
+                pixels.append((x, y, *group, pointer or cls._DENSE_EOF))
+            else:
+                pixels.append((x, y, group[0], pointer, group[1]))
+
+        metadata = {"format": format_version, "atlas": cls._ATLAS_INDEX_VERSION}
+        cls._save_image(
+            pixels, output_path, metadata=metadata,
+            chunks={cls._ATLAS_INDEX_CHUNK: zlib.compress(index, 9)},
+        )
+
+    @classmethod
+    def open_atlas(cls, image_path: str | Path) -> AtlasReader:
+        """
+        Open an image written by encode_atlas() for lookups.
+        
+        Args:
+            image_path: Path to the atlas PNG file
             
-        return bytes_list
+        Returns:
+            AtlasReader giving access to the entries by key
+        """
+        return AtlasReader(image_path, codec=cls)
+
+    @classmethod
+    def plan(
+        cls,
+        length: int,
+        *,
+        random_seed: int | None = None,
+        format_version: int = FORMAT_LEGACY,
+        max_canvas_pixels: int | None = None,
+    ) -> EncodingPlan:
+        """
+        Predict the canvas and cost of encoding ``length`` bytes.
+        
+        Without a seed the layout is random anyway, so the canvas is
+        estimated in constant time as the 95th percentile of the walk's
+        bounding box (_PLAN_CANVAS_PER_PIXEL_P95), so that an admission
+        limit rarely lets a larger canvas through; the mean walk covers
+        about 3.5 times the pixel count. With a seed the walk geometry is simulated
+        and matches the real encode exactly, which costs most of the
+        encode's own time. ``max_canvas_pixels`` stops that walk as soon as
+        the canvas outgrows it, for admission control.
+        
+        Args:
+            length: Payload size in bytes
+            random_seed: Seed the encode will use (None for an estimate)
+            format_version: FORMAT_LEGACY or FORMAT_DENSE
+            max_canvas_pixels: Stop a seeded walk once its canvas is larger
+            
+        Returns:
+            EncodingPlan with bounding box, pixel count, fill ratio and
+            estimated peak memory and wall time. ``exact`` is False for an
+            estimate and ``complete`` False for a walk stopped early, whose
+            bounding box is only a lower bound.
+            
+        Raises:
+            ValueError: If the format is unknown
+            WalkDeadEndError: If the seeded walk dead-ends, in which case
+                encoding with that seed fails too
+        """
+        if format_version not in cls._FORMATS:
+            raise ValueError(f"Unsupported format version: {format_version}")
+        pixel_count = cls._pixel_count(length, format_version)
+        walk_seconds = pixel_count * cls._PLAN_WALK_SECONDS_PER_PIXEL
+        exact = random_seed is not None
+        complete = True
+
+        min_x = min_y = max_x = max_y = 0
+        if pixel_count <= 1:
+            pass
+        elif not exact:
+            # a square-ish box of the 95th percentile area
+            area = max(pixel_count, round(pixel_count * cls._PLAN_CANVAS_PER_PIXEL_P95))
+            max_x = math.isqrt(area - 1)
+            max_y = -(-area // (max_x + 1)) - 1
+        else:
+            rng = random.Random(random_seed)
+            started = time.perf_counter()
+            placed = 0
+            try:
+                for x, y, _ in cls._iter_walk(pixel_count, rng):
+                    placed += 1
+                    if min_x <= x <= max_x and min_y <= y <= max_y:
+                        continue
+                    min_x, max_x = min(min_x, x), max(max_x, x)
+                    min_y, max_y = min(min_y, y), max(max_y, y)
+                    if (
+                        max_canvas_pixels is not None
+                        and (max_x - min_x + 1) * (max_y - min_y + 1) > max_canvas_pixels
+                    ):
+                        complete = False
+                        break
+            except WalkDeadEndError as exc:
+                raise WalkDeadEndError(
+                    f"Walk with seed {random_seed} dead-ends after "
+                    f"{placed + 1} of {pixel_count} pixels"
+                ) from exc
+            if complete:
+                walk_seconds = time.perf_counter() - started
+
+        canvas_pixels = (max_x - min_x + 1) * (max_y - min_y + 1) if pixel_count else 0
+        return EncodingPlan(
+            length=length,
+            pixel_count=pixel_count,
+            min_x=min_x,
+            min_y=min_y,
+            max_x=max_x,
+            max_y=max_y,
+            peak_memory=(
+                pixel_count * cls._PLAN_BYTES_PER_PIXEL
+                + canvas_pixels * cls._PLAN_BYTES_PER_CANVAS_PIXEL
+            ),
+            estimated_seconds=(
+                walk_seconds
+                + pixel_count * cls._PLAN_SECONDS_PER_PIXEL
+                + canvas_pixels * cls._PLAN_SECONDS_PER_CANVAS_PIXEL
+            ),
+            exact=exact,
+            complete=complete,
+        )
+
+    @classmethod
+    def walk_layout(
+        cls,
+        pixel_count: int,
+        *,
+        random_seed: int,
+        format_version: int = FORMAT_LEGACY,
+    ) -> WalkLayout:
+        """
+        Run the seeded walk for ``pixel_count`` pixels and keep its layout.
+        
+        Any payload needing that many pixels can then be encoded with
+        encode_with_layout() without walking again, e.g. through
+        app.cache.LayoutCache.
+        
+        Args:
+            pixel_count: Pixels of the payloads the layout is for
+            random_seed: Seed the walk uses
+            format_version: FORMAT_LEGACY or FORMAT_DENSE
+        """
+        if format_version not in cls._FORMATS:
+            raise ValueError(f"Unsupported format version: {format_version}")
+        if pixel_count <= 0:
+            raise ValueError("pixel_count must be positive")
+
+        walk = cls._walk_array(pixel_count, random.Random(random_seed))
+        xs = walk[:, 0] - walk[:, 0].min()
+        ys = walk[:, 1] - walk[:, 1].min()
+        width, height = int(xs.max()) + 1, int(ys.max()) + 1
+        return cls._make_layout(
+            format_version, width, height, ys * width + xs, walk[:, 2].astype(np.uint8)
+        )
+
+    @classmethod
+    def encode_with_layout(
+        cls,
+        data: bytes,
+        layout: WalkLayout,
+        output_path: str | Path,
+        *,
+        scratch: ScratchArena | None = None,
+        **png_options,
+    ) -> None:
+        """
+        Encode bytes along a precomputed walk layout.
+        
+        Only the data channels are scattered into a copy of the layout's
+        template canvas, so the output equals encode_bytes() with the
+        layout's seed and format at a fraction of the cost.
+        
+        Args:
+            data: Raw bytes to encode
+            layout: Layout from walk_layout() for the payload's pixel count
+            output_path: Where to save the PNG file
+            scratch: Arena providing the canvas buffers
+            
+        Raises:
+            ValueError: If the layout is for a different pixel count
+        """
+        data_channels, _ = cls._FORMATS[layout.format_version]
+        per_pixel = len(data_channels)
+        count = cls._pixel_count(len(data), layout.format_version)
+        if count != layout.pixel_count:
+            raise ValueError(
+                f"Layout is for {layout.pixel_count} pixels, the payload needs {count}"
+            )
+
+        scratch = scratch if scratch is not None else ScratchArena()
+        canvas = scratch.take("canvas", layout.template.shape)
+        canvas[...] = layout.template
+        flat = canvas.reshape(-1, 4)
+
+        # data channels, the last pixel zero padded as in the template
+        values = np.frombuffer(data, dtype=np.uint8)
+        full = values.size // per_pixel
+        rows = values[:full * per_pixel].reshape(full, per_pixel)
+        for column, channel in enumerate(data_channels):
+            flat[layout.offsets[:full], channel] = rows[:, column]
+        for column, value in enumerate(values[full * per_pixel:].tolist()):
+            flat[layout.offsets[full], data_channels[column]] = value
+
+        metadata = None
+        if layout.format_version == cls.FORMAT_DENSE:
+            metadata = {"format": layout.format_version, "length": len(data)}
+        cls._write_png(
+            output_path, canvas, metadata=metadata, scratch=scratch, **png_options
+        )
+
+    @classmethod
+    def _make_layout(
+        cls,
+        format_version: int,
+        width: int,
+        height: int,
+        offsets: np.ndarray,
+        pointers: np.ndarray,
+    ) -> WalkLayout:
+        """Build a WalkLayout and its template canvas from the walk arrays."""
+        _, pointer_channel = cls._FORMATS[format_version]
+        template = np.zeros((height, width, 4), dtype=np.uint8)
+        flat = template.reshape(-1, 4)
+        flat[offsets, pointer_channel] = pointers
+        if format_version == cls.FORMAT_DENSE:
+            flat[offsets[-1], 3] = cls._DENSE_EOF
+        else:
+            flat[offsets, 3] = 255
+        return WalkLayout(format_version, width, height, offsets, pointers, template)
+
+    @classmethod
+    def search_seed(
+        cls,
+        data: bytes,
+        *,
+        seeds: int | None = None,
+        time_budget: float | None = None,
+        metric: str | None = None,
+        random_seed: int | None = None,
+        format_version: int = FORMAT_LEGACY,
+        max_workers: int | None = None,
+    ) -> int:
+        """
+        Find the seed among ``seeds`` candidates giving the smallest output.
+        
+        Candidates are ``random_seed``, ``random_seed + 1``, ... (a random
+        start without a seed), so the winner is never worse than the seed
+        alone. Each is scored in a worker process by simulating the walk:
+        "area" ranks by canvas pixels, "compressed" also scatters the
+        payload and ranks by a fast deflate of the canvas. Seeds whose walk
+        dead-ends are skipped.
+        
+        Args:
+            data: Raw bytes that will be encoded
+            seeds: Number of candidates (default OPTIMIZE_SEEDS)
+            time_budget: Stop waiting after this many seconds and take the
+                best seed scored so far; the first candidate is always
+                waited for (default OPTIMIZE_TIME_BUDGET)
+            metric: "area" or "compressed" (default OPTIMIZE_METRIC)
+            random_seed: First candidate (None for random)
+            format_version: FORMAT_LEGACY or FORMAT_DENSE
+            max_workers: Worker processes (None for one per CPU)
+            
+        Returns:
+            The winning seed
+        """
+        seeds = cls.OPTIMIZE_SEEDS if seeds is None else seeds
+        time_budget = cls.OPTIMIZE_TIME_BUDGET if time_budget is None else time_budget
+        metric = cls.OPTIMIZE_METRIC if metric is None else metric
+        if metric not in cls._OPTIMIZE_METRICS:
+            raise ValueError(f"Unknown optimize metric: {metric}")
+        if seeds <= 0:
+            raise ValueError("seeds must be positive")
+        if format_version not in cls._FORMATS:
+            raise ValueError(f"Unsupported format version: {format_version}")
+        
+        first = random_seed if random_seed is not None else random.getrandbits(32)
+        if seeds == 1:
+            return first
+        
+        # the area only depends on the length, spare the workers the payload
+        payload = data if metric == "compressed" else len(data)
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        pool = cls._process_pool(max_workers)
+        pending = set()
+        try:
+            futures = {
+                pool.submit(cls._score_seed, payload, first + i, format_version, metric): i
+                for i in range(seeds)
+            }
+            scores, error = [], None
+            pending = set(futures)
+            first_future = next(iter(futures))
+            while pending:
+                # once the first candidate is done and a seed is scored, wait
+                # no longer than the deadline: the seed alone is never beaten
+                timeout = None
+                if deadline is not None and scores and first_future not in pending:
+                    timeout = max(0.0, deadline - time.monotonic())
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    try:
+                        scores.append((future.result(), futures[future]))
+                    except WalkDeadEndError as exc:
+                        error = exc
+        finally:
+            # when out of time, drop queued candidates and let running ones
+            # finish on their own instead of waiting for them
+            pool.shutdown(wait=not pending, cancel_futures=True)
+        
+        if not scores:
+            raise error
+        _, index = min(scores)
+        return first + index
+
+    @classmethod
+    def _process_pool(cls, max_workers: int | None) -> ProcessPoolExecutor:
+        """Process pool started with PROCESS_START_METHOD."""
+        return ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context(cls.PROCESS_START_METHOD),
+        )
+
+    @classmethod
+    def _score_seed(
+        cls, payload: bytes | int, random_seed: int, format_version: int, metric: str
+    ) -> int:
+        """
+        Size of an encode with one seed, by ``metric``. ``payload`` is the
+        data for "compressed" and only its length for "area".
+        """
+        if metric == "area":
+            return cls.plan(
+                payload, random_seed=random_seed, format_version=format_version
+            ).canvas_pixels
+        
+        scratch = ScratchArena()
+        pixels = cls._layout_pixels(
+            payload, random.Random(random_seed), format_version, scratch
+        )
+        canvas = cls._rasterize(pixels, scratch)
+        # one filter byte per scanline, as written by _write_png()
+        return len(zlib.compress(canvas, 1)) + canvas.shape[0]
+
+    @classmethod
+    def encode_sharded(
+        cls,
+        data: bytes,
+        output_dir: str | Path,
+        *,
+        shard_size: int = SHARD_SIZE,
+        random_seed: int | None = None,
+        format_version: int = FORMAT_LEGACY,
+        max_workers: int | None = None,
+    ) -> Path:
+        """
+        Encode bytes as a directory of PNG shards plus a JSON manifest.
+        
+        Args:
+            data: Raw bytes to encode
+            output_dir: Directory receiving the shards and manifest
+            shard_size: Payload bytes per shard
+            random_seed: Seed for reproducible output (shard i uses seed + i)
+            format_version: FORMAT_LEGACY or FORMAT_DENSE
+            max_workers: Worker processes (None for one per CPU)
+            
+        Returns:
+            Path of the written manifest
+        """
+        if shard_size <= 0:
+            raise ValueError("shard_size must be positive")
+
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        shards = []
+        for index, offset in enumerate(range(0, len(data), shard_size)):
+            chunk = data[offset:offset + shard_size]
+            shards.append({
+                "index": index,
+                "file": f"shard_{index:05d}.png",
+                "offset": offset,
+                "length": len(chunk),
+                "sha256": hashlib.sha256(chunk).hexdigest(),
+            })
+
+        # shards are independent walks, so encode them in parallel
+        with cls._process_pool(max_workers) as pool:
+            futures = [
+                pool.submit(
+                    cls.encode_bytes,
+                    data[shard["offset"]:shard["offset"] + shard["length"]],
+                    output_dir / shard["file"],
+                    random_seed=(
+                        None if random_seed is None else random_seed + shard["index"]
+                    ),
+                    format_version=format_version,
+                )
+                for shard in shards
+            ]
+            for future in as_completed(futures):
+                future.result()
+
+        manifest = {
+            "version": cls._MANIFEST_VERSION,
+            "length": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "shard_size": shard_size,
+            "shards": shards,
+        }
+        manifest_path = output_dir / cls.MANIFEST_NAME
+        manifest_path.write_text(json.dumps(manifest, indent=2))
+        return manifest_path
+
+    @classmethod
+    def encode_file_sharded(
+        cls,
+        input_path: str | Path,
+        output_dir: str | Path,
+        **kwargs,
+    ) -> Path:
+        """
+        Encode a file as PNG shards; see encode_sharded() for options.
+        
+        Args:
+            input_path: Path to the file to encode
+            output_dir: Directory receiving the shards and manifest
+            
+        Returns:
+            Path of the written manifest
+        """
+        with open(input_path, 'rb') as f:
+            data = f.read()
+
+        return cls.encode_sharded(data, output_dir, **kwargs)
+
+    @classmethod
+    def decode_sharded(
+        cls,
+        manifest_path: str | Path,
+        output_path: str | Path,
+        *,
+        max_workers: int | None = None,
+    ) -> int:
+        """
+        Rebuild a file from the shards listed in a manifest.
+        
+        Decoding is resumable: shards whose byte range in an existing
+        output file already matches the manifest checksum are skipped.
+        
+        Args:
+            manifest_path: Path to the manifest written by encode_sharded()
+            output_path: Where to save the decoded file
+            max_workers: Worker processes (None for one per CPU)
+            
+        Returns:
+            Number of shards that had to be decoded
+            
+        Raises:
+            ValueError: If the manifest is unsupported, names a shard outside
+                its directory, has shards that do not cover its length
+                contiguously or a checksum fails
+        """
+        manifest_path = Path(manifest_path)
+        manifest = json.loads(manifest_path.read_text())
+        if manifest.get("version") != cls._MANIFEST_VERSION:
+            raise ValueError(
+                f"Unsupported manifest version: {manifest.get('version')}"
+            )
+
+        # shards must live next to the manifest, never elsewhere on disk
+        for shard in manifest["shards"]:
+            name = shard["file"]
+            if (
+                not isinstance(name, str)
+                or name in ("", ".", "..")
+                or "/" in name
+                or "\\" in name
+                or Path(name).name != name
+            ):
+                raise ValueError(f"Shard file is not a plain file name: {name!r}")
+
+        # and tile the output in order, before it is created or truncated
+        offset = 0
+        for shard in manifest["shards"]:
+            length = shard["length"]
+            if type(length) is not int or length < 0:
+                raise ValueError(f"Shard length is not a non-negative integer: {length!r}")
+            if type(shard["offset"]) is not int or shard["offset"] != offset:
+                raise ValueError(
+                    f"Shard {shard['file']!r} starts at {shard['offset']!r}, "
+                    f"expected {offset}"
+                )
+            offset += length
+        if type(manifest["length"]) is not int or manifest["length"] != offset:
+            raise ValueError(
+                f"Manifest length {manifest['length']!r} does not match "
+                f"its shards ({offset} bytes)"
+            )
+
+        output_path = Path(output_path)
+        mode = 'r+b' if output_path.exists() else 'w+b'
+        with open(output_path, mode) as out:
+            out.truncate(manifest["length"])
+
+            # skip shards already present in a previous partial output
+            pending = []
+            for shard in manifest["shards"]:
+                out.seek(shard["offset"])
+                existing = out.read(shard["length"])
+                if hashlib.sha256(existing).hexdigest() != shard["sha256"]:
+                    pending.append(shard)
+
+            if pending:
+                with cls._process_pool(max_workers) as pool:
+                    futures = {
+                        pool.submit(
+                            cls._decode_shard,
+                            manifest_path.parent / shard["file"],
+                            shard["length"],
+                            shard["sha256"],
+                        ): shard
+                        for shard in pending
+                    }
+                    for future in as_completed(futures):
+                        out.seek(futures[future]["offset"])
+                        out.write(future.result())
+
+            # verify the reassembled file
+            out.seek(0)
+            digest = hashlib.sha256()
+            while block := out.read(1 << 20):
+                digest.update(block)
+            if digest.hexdigest() != manifest["sha256"]:
+                raise ValueError("Decoded file does not match manifest checksum")
+
+        return len(pending)
+
+    @classmethod
+    def _decode_shard(cls, image_path: Path, length: int, sha256: str) -> bytes:
+        """Decode one shard and verify it against its manifest entry."""
+        # legacy images lose trailing zeros, the manifest length restores them
+        data = cls.decode_bytes(image_path)[:length].ljust(length, b"\x00")
+        if hashlib.sha256(data).hexdigest() != sha256:
+            raise ValueError(f"Checksum mismatch in shard {image_path.name}")
+        return data
+    
+    @classmethod
+    def _decode_payload(
+        cls,
+        image_path: str | Path,
+        *,
+        kind: str | None = None,
+        into=None,
+        max_canvas_pixels: int | None = None,
+        max_output_bytes: int | None = None,
+        time_budget: float | None = None,
+    ) -> Tuple[bytes | np.ndarray, dict]:
+        """
+        Decode the chain of an image and return it with the image metadata.
+        
+        ``kind`` names the special image kind expected ("delta"), None for
+        a plain payload; images of another kind are rejected. ``into`` is
+        called with the metadata and returns a writable uint8 array of the
+        recorded payload length; the payload is scattered into it and it is
+        returned instead of bytes. See decode_bytes() for the limits.
+        """
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        
+        # load the canvas and detect the format
+        try:
+            img = Image.open(image_path)
+        except Image.DecompressionBombError as error:
+            raise CanvasTooLargeError(str(error)) from None
+        with img:
+            width, height = img.size
+            if max_canvas_pixels is not None and width * height > max_canvas_pixels:
+                raise CanvasTooLargeError(
+                    f"Canvas of {width}x{height} exceeds {max_canvas_pixels} pixels"
+                )
+            metadata = cls._read_metadata(img)
+            cls._check_kind(metadata, kind)
+            version = cls._format_version(metadata)
+            data_channels, pointer_channel = cls._FORMATS[version]
+            length = cls._payload_length(metadata)
+            rgba = np.asarray(img.convert("RGBA"))
+        cls._check_deadline(deadline)
+        
+        # the chain holds at most one pixel per opaque pixel, and resolving
+        # it builds all of their bytes whatever length the metadata claims
+        opaque = np.count_nonzero(rgba[..., 3])
+        if not opaque:
+            raise DecodeError("No payload found in the image")
+        if max_output_bytes is not None:
+            size = max(opaque * len(data_channels), length or 0)
+            if size > max_output_bytes:
+                raise OutputTooLargeError(
+                    f"Payload of up to {size} bytes exceeds {max_output_bytes} bytes"
+                )
+            
+        target = None
+        if into is not None:
+            target = into(metadata)
+            if target.size != length:
+                raise DecodeError(
+                    f"Destination of {target.size} bytes does not match "
+                    f"the recorded payload length ({length})"
+                )
+        
+        data = cls._resolve_chain(
+            rgba, data_channels, pointer_channel, deadline=deadline, out=target
+        )
+        if data is None:
+            # irregular chain - walk it pixel by pixel to report the problem
+            pixel_data = cls._pixels_from_array(
+                rgba, keep_alpha=version != cls.FORMAT_LEGACY
+            )
+            start_pixel = cls._find_start_pixel(pixel_data, pointer_channel)
+            byte_sequence = cls._extract_bytes(
+                pixel_data, start_pixel,
+                data_channels=data_channels, pointer_channel=pointer_channel,
+                deadline=deadline,
+            )
+            data = bytes(byte_sequence)
+            if target is not None:
+                if len(data) < length:
+                    raise DecodeError("Payload is shorter than its recorded length")
+                target[:] = np.frombuffer(data, dtype=np.uint8, count=length)
+                data = target
+        if target is not None:
+            return target, metadata
+
+        # exact length is recorded by versioned formats
+        if length is not None:
+            if len(data) < length:
+                raise DecodeError("Payload is shorter than its recorded length")
+            return data[:length], metadata
+        
+        #  remove any trailing null padding
+        return data.rstrip(b"\x00"), metadata
+
+
+    @classmethod
+    def _payload_length(cls, metadata: dict) -> int | None:
+        """Exact payload length recorded in the metadata, if any."""
+        if "length" not in metadata:
+            return None
+        try:
+            length = int(metadata["length"])
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise DecodeError(f"Invalid payload length: {metadata['length']}")
+        return length
+
+    @staticmethod
+    def _check_deadline(deadline: float | None) -> None:
+        """Raise DecodeTimeoutError once the monotonic ``deadline`` passed."""
+        if deadline is not None and time.monotonic() > deadline:
+            raise DecodeTimeoutError("Decoding exceeded its time budget")
+
+    @classmethod
+    def _check_kind(cls, metadata: dict, expected: str | None) -> None:
+        """Reject images whose kind (plain, atlas, delta) is not ``expected``."""
+        kind = next((k for k in cls._IMAGE_KINDS if k in metadata), None)
+        if kind == expected:
+            return
+        if kind is None:
+            raise DecodeError(f"Image is not {cls._IMAGE_KINDS[expected][0]}")
+        name, reader = cls._IMAGE_KINDS[kind]
+        raise DecodeError(f"Image is {name}, read it with {reader}")
+
+    @classmethod
+    def _encode_to_png(
+        cls,
+        data: bytes,
+        output_path: str | Path,
+        rng,
+        format_version: int,
+        *,
+        metadata: dict | None = None,
+        **save_options,
+    ) -> None:
+        """
+        Lay out ``data`` in the given format and save it with _save_image().
+        
+        Extra ``metadata`` is stored with the exact payload length, which
+        legacy images otherwise lose to trailing-zero stripping.
+        """
+        if save_options.get("scratch") is None:
+            save_options["scratch"] = ScratchArena()
+        pixels = cls._layout_pixels(data, rng, format_version, save_options["scratch"])
+        if format_version == cls.FORMAT_DENSE:
+            metadata = {"format": format_version, "length": len(data), **(metadata or {})}
+        elif metadata:
+            metadata = {"length": len(data), **metadata}
+        cls._save_image(pixels, output_path, metadata=metadata, **save_options)
+
+    @classmethod
+    def _layout_pixels(
+        cls,
+        data,
+        rng,
+        format_version: int,
+        scratch: ScratchArena | None = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Walk ``data`` out into the pixels of the given format.
+        
+        ``data`` may be any bytes-like buffer; it is read in place. Returns
+        the int64 (x, y, pointer) rows of the walk and the matching uint8
+        RGBA rows, as taken by _save_image(); both are views of ``scratch``
+        buffers when given.
+        """
+        if format_version not in cls._FORMATS:
+            raise ValueError(f"Unsupported format version: {format_version}")
+        data_channels, pointer_channel = cls._FORMATS[format_version]
+        per_pixel = len(data_channels)
+        
+        values = np.frombuffer(data, dtype=np.uint8)
+        count = cls._pixel_count(values.size, format_version)
+        if not count:
+            raise ValueError("Cannot encode empty data in the legacy format")
+        scratch = scratch if scratch is not None else ScratchArena()
+        walk = cls._walk_array(
+            count, rng, out=scratch.take("walk", (count, 3), np.int64)
+        )
+        
+        rgba = scratch.take("rgba", (count, 4), zero=True)
+        rgba[:, pointer_channel] = walk[:, 2]
+        
+        # data channels, the last pixel zero padded
+        columns = list(data_channels)
+        full = values.size // per_pixel
+        rgba[:full, columns] = values[:full * per_pixel].reshape(full, per_pixel)
+        tail = values[full * per_pixel:]
+        if tail.size:
+            rgba[full, columns[:tail.size]] = tail
+        if format_version == cls.FORMAT_DENSE:
+            rgba[-1, 3] = cls._DENSE_EOF
+        else:
+            rgba[:, 3] = 255
+        return walk, rgba
+
+    @classmethod
+    def _pixel_count(cls, length: int, format_version: int) -> int:
+        """Pixels needed for ``length`` bytes; dense always has an EOF pixel."""
+        count = -(-length // len(cls._FORMATS[format_version][0]))
+        return max(1, count) if format_version == cls.FORMAT_DENSE else count
+
+    @classmethod
+    def _walk_array(
+        cls, count: int, rng, out: np.ndarray | None = None
+    ) -> np.ndarray:
+        """
+        The walk as an int64 array of (x, y, pointer) rows.
+        
+        With ``out`` the rows are converted _WALK_CHUNK at a time straight
+        into it, so a walk of any length allocates a single chunk.
+        """
+        triples = itertools.chain.from_iterable(cls._iter_walk(count, rng))
+        if out is None:
+            return np.fromiter(triples, dtype=np.int64, count=3 * count).reshape(count, 3)
+        
+        for start in range(0, count, cls._WALK_CHUNK):
+            rows = min(cls._WALK_CHUNK, count - start)
+            out[start:start + rows] = np.fromiter(
+                triples, dtype=np.int64, count=3 * rows
+            ).reshape(rows, 3)
+        return out
+
+    @classmethod
+    def _walk(cls, count: int, rng) -> List[Tuple[int, int, int]]:
+        """Lay out a chain of ``count`` positions as (x, y, pointer) triples."""
+        return list(cls._iter_walk(count, rng))
+
+    @classmethod
+    def _iter_walk(
+        cls, count: int, rng, used_positions=None
+    ) -> Iterator[Tuple[int, int, int]]:
+        """
+        Yield the (x, y, pointer) triples of _walk() one at a time.
+        
+        ``used_positions`` may be any set-like container of (x, y) with
+        ``in`` and add(), such as a disk-backed bitmap (default a set).
+        """
+        if used_positions is None:
+            used_positions = set()
+        used_positions.add((0, 0))
+        current_x = current_y = 0
+
+        for idx in range(count):
+            # determine pointer value (to next pixel or EOF)
+            if idx < count - 1:
+                # find next available position
+                next_x, next_y, pointer = cls._find_next_position(
+                    current_x, current_y, used_positions, rng
+                )
+                used_positions.add((next_x, next_y))
+            else:
+                # last pixel - EOF sentinel
+                pointer = 0
+                next_x = next_y = None
+
+            yield current_x, current_y, pointer
+
+            if next_x is not None:
+                current_x, current_y = next_x, next_y
+    
+    @classmethod
+    def _find_next_position(
+        cls, x: int, y: int, used: set, rng
+    ) -> Tuple[int, int, int]:
+        """Find next available position and return coordinates + green value."""
+        directions = list(cls._DIRECTIONS)  # copy the directions list
+        
+        while directions:
+            dx, dy = rng.choice(directions)
+            directions.remove((dx, dy))  # remove this direction to avoid retrying
+            
+            for distance in range(1, cls.MAX_DISTANCE + 1):
+                next_x, next_y = x + dx * distance, y + dy * distance
+                if (next_x, next_y) not in used:
+                    direction_code = cls._DIR_BITS[(dx, dy)]
+                    green = (distance << 2) | direction_code
+                    return next_x, next_y, green
+        
+        # all directions at all distances are blocked
+        raise WalkDeadEndError("No available positions found within max_dist")
+    
+    @classmethod
+    def _save_image(
+        cls, 
+        pixels: List[Tuple[int, ...]] | Tuple[np.ndarray, np.ndarray],
+        output_path: str | Path,
+        *,
+        metadata: dict | None = None,
+        scratch: ScratchArena | None = None,
+        max_canvas_pixels: int | None = None,
+        **png_options,
+    ) -> None:
+        """
+        Create and save the PNG image from pixel data.
+
+        Pixels are a list of (x, y, r, g, b) tuples drawn fully opaque or
+        (x, y, r, g, b, a) tuples carrying their own alpha, or the (walk,
+        rgba) arrays of _layout_pixels(). ``metadata``
+        entries are written as PNG text chunks. Buffers come from
+        ``scratch`` when given; ``png_options`` go to _write_png().
+
+        Raises:
+            ValueError: If the canvas exceeds ``max_canvas_pixels``
+        """
+        scratch = scratch if scratch is not None else ScratchArena()
+        canvas = cls._rasterize(pixels, scratch, max_canvas_pixels)
+        cls._write_png(
+            output_path, canvas, metadata=metadata, scratch=scratch, **png_options
+        )
+
+    @classmethod
+    def _rasterize(
+        cls,
+        pixels: List[Tuple[int, ...]] | Tuple[np.ndarray, np.ndarray],
+        scratch: ScratchArena,
+        max_canvas_pixels: int | None = None,
+    ) -> np.ndarray:
+        """Place pixels on a transparent RGBA canvas cropped to them."""
+        if isinstance(pixels, tuple):
+            positions, rgba = pixels
+        else:
+            positions = scratch.take("pixels", (len(pixels), len(pixels[0])), np.int64)
+            positions[...] = pixels
+            rgba = scratch.take("rgba", (len(pixels), 4))
+            rgba[:, :3] = positions[:, 2:5]
+            rgba[:, 3] = positions[:, 5] if positions.shape[1] > 5 else 255
+
+        # calculate canvas bounds
+        xs, ys = positions[:, 0], positions[:, 1]
+        min_x, min_y = int(xs.min()), int(ys.min())
+        
+        width = int(xs.max()) - min_x + 1
+        height = int(ys.max()) - min_y + 1
+        if max_canvas_pixels is not None and width * height > max_canvas_pixels:
+            raise ValueError(
+                f"Canvas of {width}x{height} exceeds {max_canvas_pixels} pixels"
+            )
+        
+        # create transparent canvas and place pixels
+        canvas = scratch.take("canvas", (height, width, 4), zero=True)
+        canvas[ys - min_y, xs - min_x] = rgba
+        return canvas
+
+    @classmethod
+    def _write_png(
+        cls,
+        output_path: str | Path,
+        rgba: np.ndarray,
+        *,
+        metadata: dict | None = None,
+        chunks: dict | None = None,
+        compress_level: int | None = None,
+        band_bytes: int | None = None,
+        max_workers: int | None = None,
+        scratch: ScratchArena | None = None,
+        pool: ThreadPoolExecutor | None = None,
+    ) -> None:
+        """
+        Write an RGBA canvas as a PNG, compressing row bands in parallel.
+        
+        Scanlines are split into bands of about ``band_bytes`` that are
+        deflated concurrently (zlib releases the GIL). Every band but the
+        last ends on a full flush and is primed with the previous band's
+        last 32 KiB, so the bands concatenate into one valid zlib stream
+        with close to single-stream compression, as pigz does.
+        
+        Args:
+            output_path: Where to save the PNG file
+            rgba: uint8 array of shape (height, width, 4)
+            metadata: Entries written as prefixed tEXt (zTXt if long) chunks
+            chunks: Extra chunks by type, written after the metadata
+            compress_level: zlib level (default PNG_COMPRESS_LEVEL)
+            band_bytes: Uncompressed bytes per band (default PNG_BAND_BYTES)
+            max_workers: Compression threads (default PNG_WORKERS)
+            scratch: Arena providing the scanline buffer
+            pool: Thread pool to compress on instead of a temporary one
+        """
+        level = cls.PNG_COMPRESS_LEVEL if compress_level is None else compress_level
+        band_bytes = cls.PNG_BAND_BYTES if band_bytes is None else band_bytes
+        workers = cls.PNG_WORKERS if max_workers is None else max_workers
+        
+        height, width = rgba.shape[:2]
+        
+        # filter type 0 (None) on every scanline
+        if scratch is None:
+            scanlines = np.empty((height, width * 4 + 1), dtype=np.uint8)
+        else:
+            scanlines = scratch.take("scanlines", (height, width * 4 + 1))
+        scanlines[:, 0] = 0
+        scanlines[:, 1:] = rgba.reshape(height, width * 4)
+        rows_per_band = max(1, band_bytes // scanlines.shape[1])
+        bands = [
+            scanlines[start:start + rows_per_band]
+            for start in range(0, height, rows_per_band)
+        ]
+        
+        # a lone band smaller than the 32 KiB window gets a window (and hash
+        # and block buffer) sized to it: the matches found are the same, and
+        # deflate's ~300 KiB of per-stream state shrinks with the image
+        window_bits, mem_level = 15, 8
+        if len(bands) == 1:
+            window_bits = min(15, max(9, (scanlines.nbytes + 262).bit_length()))
+            mem_level = min(8, max(1, (scanlines.nbytes - 1).bit_length() - 6))
+        
+        def compress(index: int) -> bytes:
+            # raw deflate primed with the window the decoder will have seen
+            options = {}
+            if index:
+                options["zdict"] = bands[index - 1].reshape(-1)[-32768:].tobytes()
+            compressor = zlib.compressobj(
+                level, zlib.DEFLATED, -window_bits, mem_level, **options
+            )
+            last = index == len(bands) - 1
+            return compressor.compress(bands[index]) + compressor.flush(
+                zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH
+            )
+        
+        if len(bands) == 1:
+            deflated = [compress(0)]
+        elif pool is not None:
+            deflated = list(pool.map(compress, range(len(bands))))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                deflated = list(pool.map(compress, range(len(bands))))
+        
+        # one zlib stream: header, bands, checksum of the filtered data
+        adler = 1
+        for band in bands:
+            adler = zlib.adler32(band, adler)
+        deflated[0] = cls._zlib_header(level) + deflated[0]
+        deflated[-1] += struct.pack(">I", adler)
+        
+        with open(output_path, 'wb') as f:
+            f.write(cls._png_preamble(width, height, metadata, level, chunks))
+            for chunk in deflated:
+                f.write(cls._png_chunk(b"IDAT", chunk))
+            f.write(cls._png_chunk(b"IEND", b""))
+
+    @classmethod
+    def _png_preamble(
+        cls,
+        width: int,
+        height: int,
+        metadata: dict | None,
+        level: int,
+        chunks: dict | None = None,
+    ) -> bytes:
+        """PNG signature, RGBA8 header, metadata text chunks and ``chunks``."""
+        parts = [
+            b"\x89PNG\r\n\x1a\n",
+            cls._png_chunk(
+                b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+            ),
+        ]
+        for key, value in (metadata or {}).items():
+            keyword = (cls._META_PREFIX + key).encode("latin-1")
+            text = str(value).encode("latin-1")
+            if len(text) > cls._PNG_ZTXT_THRESHOLD:
+                # compression method 0 (deflate)
+                compressed = keyword + b"\x00\x00" + zlib.compress(text, level)
+                parts.append(cls._png_chunk(b"zTXt", compressed))
+            else:
+                parts.append(cls._png_chunk(b"tEXt", keyword + b"\x00" + text))
+        for chunk_type, payload in (chunks or {}).items():
+            parts.append(cls._png_chunk(chunk_type, payload))
+        return b"".join(parts)
+
+    @classmethod
+    def _read_png_chunk(cls, image_path: str | Path, chunk_type: bytes) -> bytes | None:
+        """
+        Payload of the first ``chunk_type`` chunk before the image data, or
+        None. Pillow skips private chunks, so the file is scanned directly.
+        """
+        with open(image_path, 'rb') as f:
+            if f.read(8) != b"\x89PNG\r\n\x1a\n":
+                raise DecodeError("Not a PNG file")
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                length, found = struct.unpack(">I4s", header)
+                if found in (b"IDAT", b"IEND"):
+                    return None
+                if found != chunk_type:
+                    f.seek(length + 4, 1)
+                    continue
+                payload = f.read(length)
+                crc = f.read(4)
+                if len(payload) < length or len(crc) < 4:
+                    raise DecodeError(f"Truncated {chunk_type.decode()} chunk")
+                if struct.unpack(">I", crc)[0] != zlib.crc32(payload, zlib.crc32(found)):
+                    raise DecodeError(f"Corrupt {chunk_type.decode()} chunk")
+                return payload
+
+    @staticmethod
+    def _png_chunk(chunk_type: bytes, payload: bytes) -> bytes:
+        """Frame a PNG chunk with its length and CRC."""
+        crc = zlib.crc32(payload, zlib.crc32(chunk_type))
+        return (
+            struct.pack(">I", len(payload)) + chunk_type + payload
+            + struct.pack(">I", crc)
+        )
+
+    @staticmethod
+    def _zlib_header(level: int) -> bytes:
+        """Build the two-byte zlib header for a 32 KiB window and ``level``."""
+        cmf = 0x78
+        if level == zlib.Z_DEFAULT_COMPRESSION:
+            level = 6
+        flevel = 0 if level < 2 else 1 if level < 6 else 2 if level == 6 else 3
+        flg = flevel << 6
+        flg |= (31 - (cmf * 256 + flg) % 31) % 31  # FCHECK
+        return bytes((cmf, flg))
+
+    @classmethod
+    def _read_metadata(cls, img: Image.Image) -> dict:
+        """Return the codec's PNG text chunks with the key prefix removed."""
+        prefix = cls._META_PREFIX
+        return {
+            key[len(prefix):]: value
+            for key, value in img.info.items()
+            if isinstance(key, str) and key.startswith(prefix)
+        }
+
+    @classmethod
+    def _format_version(cls, metadata: dict) -> int:
+        """Detect the format version; images without one are legacy."""
+        try:
+            version = int(metadata.get("format", cls.FORMAT_LEGACY))
+        except ValueError:
+            version = None
+        if version not in cls._FORMATS:
+            raise DecodeError(f"Unsupported format version: {metadata['format']}")
+        return version
+    
+    @classmethod
+    def _load_pixel_data(cls, image_path: str | Path) -> dict:
+        """Load non-transparent pixels from image."""
+        with Image.open(image_path) as img:
+            return cls._scan_pixels(img)
+
+    @classmethod
+    def _scan_pixels(cls, img: Image.Image, *, keep_alpha: bool = False) -> dict:
+        """Collect non-transparent pixels as (r, g, b) or (r, g, b, a)."""
+        return cls._pixels_from_array(
+            np.asarray(img.convert("RGBA")), keep_alpha=keep_alpha
+        )
+
+    @classmethod
+    def _pixels_from_array(cls, rgba: np.ndarray, *, keep_alpha: bool = False) -> dict:
+        """Map (x, y) of every non-transparent pixel to its channels."""
+        ys, xs = np.nonzero(rgba[..., 3])
+        channels = rgba[ys, xs] if keep_alpha else rgba[ys, xs, :3]
+        return dict(zip(
+            zip(xs.tolist(), ys.tolist()),
+            map(tuple, channels.tolist()),
+        ))
+
+    @classmethod
+    def _find_start_pixel(
+        cls, pixel_data: dict, pointer_channel: int = 1
+    ) -> Tuple[int, int]:
+        """Find the starting pixel (not pointed to by any other pixel)."""
+        pointed_to = set()
+        
+        for (x, y), channels in pixel_data.items():
+            pointer = channels[pointer_channel]
+            distance = pointer >> 2
+            if not distance:  # EOF sentinel
+                continue
+                
+            direction_code = pointer & 0x03
+            dx, dy = cls._DIRS_DECODE[direction_code]
+            target = (x + dx * distance, y + dy * distance)
+            pointed_to.add(target)
+        
+        origins = [pos for pos in pixel_data if pos not in pointed_to]
+        
+        if len(origins) != 1:
+            raise BrokenChainError("Cannot uniquely identify the starting pixel")
+            
+        return origins[0]
+    
+    @classmethod
+    def _extract_bytes(
+        cls,
+        pixel_data: dict,
+        start: Tuple[int, int],
+        *,
+        data_channels: Tuple[int, ...] = (0, 2),
+        pointer_channel: int = 1,
+        deadline: float | None = None,
+    ) -> List[int]:
+        """
+        Follow the pixel chain and extract byte sequence.
+        
+        A visited bitmap over the pixels' bounding box stops crafted chains
+        that loop back on themselves.
+        """
+        bytes_list = []
+        current = start
+        width = max(x for x, _ in pixel_data) + 1
+        visited = bytearray(width * (max(y for _, y in pixel_data) + 1))
+        
+        for step in itertools.count():
+            if current not in pixel_data:
+                raise BrokenChainError("Broken pointer chain - missing target pixel")
+            offset = current[1] * width + current[0]
+            if visited[offset]:
+                raise PointerCycleError(f"Pointer chain loops back to pixel {current}")
+            visited[offset] = 1
+            if not step & 0xFFF:
+                cls._check_deadline(deadline)
+                
+            channels = pixel_data[current]
+            bytes_list.extend([channels[c] for c in data_channels])
+            
+            pointer = channels[pointer_channel]
+            distance = pointer >> 2
+            if not distance:  # EOF sentinel
+                break
+                
+            # follow pointer to next pixel
+            direction_code = pointer & 0x03
+            dx, dy = cls._DIRS_DECODE[direction_code]
+            current = (current[0] + dx * distance, current[1] + dy * distance)
+            
+        return bytes_list
+
+    @classmethod
+    def _resolve_chain(
+        cls,
+        rgba: np.ndarray,
+        data_channels: Tuple[int, ...] = (0, 2),
+        pointer_channel: int = 1,
+        *,
+        deadline: float | None = None,
+        out: np.ndarray | None = None,
+    ) -> bytes | np.ndarray | None:
+        """
+        Extract the byte sequence of a canvas with vectorized list ranking.
+        
+        Every opaque pixel gets the index of its successor, then pointer
+        jumping computes each pixel's distance to the EOF pixel in
+        O(log n) array passes and the data channels are scattered straight
+        into their output slots - of ``out``, a flat uint8 array receiving
+        the first ``out.size`` bytes, if given.
+        
+        Returns None unless the opaque pixels form exactly one chain (long
+        enough to fill ``out``), so the caller can fall back to
+        _extract_bytes() for error reporting.
+        """
+        linked = cls._link_pixels(rgba, pointer_channel)
+        if linked is None:
+            return None
+        _, channels, successor, is_eof = linked
+        count = successor.size
+        if np.count_nonzero(is_eof) != 1:
+            return None
+        
+        # a single chain has exactly one pixel nobody points to
+        in_degree = np.bincount(successor[~is_eof], minlength=count)
+        origins = np.flatnonzero(in_degree == 0)
+        if origins.size != 1 or in_degree.max(initial=0) > 1:
+            return None
+        
+        rank, _ = cls._rank_chains(successor, is_eof, deadline)
+        
+        # detached cycles leave the start's chain shorter than the pixel count
+        if rank[origins[0]] != count - 1:
+            return None
+        
+        per_pixel = len(data_channels)
+        slot = count - 1 - rank
+        values = channels[:, list(data_channels)]
+        if out is None:
+            output = np.empty((count, per_pixel), dtype=np.uint8)
+            output[slot] = values
+            return output.tobytes()
+        
+        # whole pixels first, then the part of the last one that fits
+        if count * per_pixel < out.size:
+            return None
+        full = out.size // per_pixel
+        keep = slot < full
+        out[:full * per_pixel].reshape(full, per_pixel)[slot[keep]] = values[keep]
+        if out.size > full * per_pixel:
+            out[full * per_pixel:] = values[slot == full][0, :out.size - full * per_pixel]
+        return out
+
+    @classmethod
+    def _resolve_chains(
+        cls,
+        rgba: np.ndarray,
+        starts: List[Tuple[int, int]],
+        counts: List[int],
+        data_channels: Tuple[int, ...],
+        pointer_channel: int,
+    ) -> List[bytes] | None:
+        """
+        Extract several chains of one canvas in a single ranking pass.
+        
+        ``starts`` are the (x, y) start pixels and ``counts`` the pixel
+        counts of the chains. Returns None unless every chain runs from its
+        start to its own EOF pixel in exactly that many pixels.
+        """
+        linked = cls._link_pixels(rgba, pointer_channel)
+        if linked is None:
+            return None
+        positions, channels, successor, is_eof = linked
+        width = rgba.shape[1]
+        counts = np.asarray(counts, dtype=np.int64)
+        
+        start_offsets = np.array([y * width + x for x, y in starts], dtype=np.int64)
+        first = np.minimum(np.searchsorted(positions, start_offsets), positions.size - 1)
+        if not np.array_equal(positions[first], start_offsets):
+            return None
+        
+        rank, terminal = cls._rank_chains(successor, is_eof)
+        ends = terminal[first]
+        if not np.all(is_eof[ends] & (rank[first] == counts - 1)):
+            return None
+        if np.unique(ends).size != ends.size:
+            return None
+        
+        # chain of every pixel, identified through its EOF pixel
+        chain_of_end = np.full(positions.size, -1, dtype=np.int64)
+        chain_of_end[ends] = np.arange(ends.size)
+        chain = chain_of_end[terminal]
+        member = np.flatnonzero(chain >= 0)
+        chain = chain[member]
+        
+        # scatter every chain into its own slice of one output array
+        base = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        slot = base[chain] + rank[first][chain] - rank[member]
+        total = int(counts.sum())
+        if slot.size != total or np.bincount(slot, minlength=total).max() != 1:
+            return None
+        output = np.empty((total, len(data_channels)), dtype=np.uint8)
+        output[slot] = channels[member][:, list(data_channels)]
+        return [
+            output[offset:offset + count].tobytes()
+            for offset, count in zip(base.tolist(), counts.tolist())
+        ]
+
+    @classmethod
+    def _link_pixels(
+        cls, rgba: np.ndarray, pointer_channel: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray] | None:
+        """
+        Index the opaque pixels of a canvas and link each to its successor.
+        
+        Returns (positions, channels, successor, is_eof): sorted flat canvas
+        offsets, channel values, successor indices with EOF pixels linked
+        to themselves, and the EOF mask. Returns None if a pointer leaves
+        the canvas or lands on a transparent pixel.
+        """
+        height, width = rgba.shape[:2]
+        flat = rgba.reshape(-1, 4)
+        positions = np.flatnonzero(flat[:, 3])  # sorted canvas offsets
+        count = positions.size
+        channels = flat[positions]
+        ys, xs = np.divmod(positions, width)
+        
+        # decode pointers to target coordinates
+        pointer = channels[:, pointer_channel].astype(np.int64)
+        distance = pointer >> 2
+        direction = pointer & 0x03
+        is_eof = distance == 0
+        target_x = xs + cls._DIR_DX[direction] * distance
+        target_y = ys + cls._DIR_DY[direction] * distance
+        inside = (
+            (target_x >= 0) & (target_x < width)
+            & (target_y >= 0) & (target_y < height)
+        )
+        if not np.all(inside | is_eof):
+            return None
+        
+        # successor index of every pixel, EOF points to itself
+        target = np.where(is_eof, positions, target_y * width + target_x)
+        successor = np.minimum(np.searchsorted(positions, target), count - 1)
+        if not np.array_equal(positions[successor], target):
+            return None  # pointer into a transparent pixel
+        successor[is_eof] = np.flatnonzero(is_eof)
+        return positions, channels, successor, is_eof
+
+    @classmethod
+    def _rank_chains(
+        cls,
+        successor: np.ndarray, is_eof: np.ndarray, deadline: float | None = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Pointer jumping: steps from every pixel to the end of its chain.
+        
+        Returns (rank, terminal) after O(log n) passes. For pixels that
+        reach an EOF pixel, rank is their distance to it and terminal its
+        index; for pixels caught in a cycle both are meaningless.
+        """
+        rank = (~is_eof).astype(np.int64)
+        terminal = successor.copy()
+        for _ in range((successor.size - 1).bit_length()):
+            cls._check_deadline(deadline)
+            rank += rank[terminal]
+            terminal = terminal[terminal]
+        return rank, terminal
+
+
+class AtlasReader:
+    """
+    Keyed access to an image written by PNGBytesCodec.encode_atlas().
+    
+    get() follows a single entry's chain from the start pixel recorded in
+    the index, so it never visits the other entries. read_all() resolves
+    every chain of the canvas in one vectorized pass.
+    """
+
+    def __init__(self, image_path: str | Path, *, codec=PNGBytesCodec) -> None:
+        """
+        Args:
+            image_path: Path to the atlas PNG file
+            codec: Codec class that wrote the atlas
+
+        Raises:
+            ValueError: If the image carries no atlas index
+        """
+        with Image.open(image_path) as img:
+            metadata = codec._read_metadata(img)
+            codec._check_kind(metadata, "atlas")
+            version = codec._format_version(metadata)
+            self._rgba = np.asarray(img.convert("RGBA"))
+
+        self.codec = codec
+        self.format_version = version
+        if metadata["atlas"].startswith("{"):
+            # JSON index of atlases written before the binary one
+            self.index = {
+                key: tuple(entry) for key, entry in json.loads(metadata["atlas"]).items()
+            }
+        else:
+            self.index = self._read_index(image_path)
+
+    def _read_index(self, image_path: str | Path) -> dict:
+        """Load the binary index chunk as key -> (x, y, length)."""
+        codec = self.codec
+        compressed = codec._read_png_chunk(image_path, codec._ATLAS_INDEX_CHUNK)
+        if compressed is None:
+            raise DecodeError("Atlas index chunk is missing")
+        inflater = zlib.decompressobj()
+        try:
+            data = inflater.decompress(compressed, codec.MAX_ATLAS_INDEX_BYTES)
+        except zlib.error as error:
+            raise DecodeError(f"Corrupt atlas index: {error}") from None
+        if inflater.unconsumed_tail:
+            raise DecodeError(
+                f"Atlas index exceeds {codec.MAX_ATLAS_INDEX_BYTES} bytes"
+            )
+
+        header = codec._ATLAS_INDEX_HEADER
+        row = codec._ATLAS_INDEX_ROW
+        if len(data) < header.size:
+            raise DecodeError("Truncated atlas index")
+        (count,) = header.unpack_from(data)
+        keys_start = header.size + count * row.itemsize
+        if len(data) < keys_start:
+            raise DecodeError("Truncated atlas index")
+        rows = np.frombuffer(data, dtype=row, count=count, offset=header.size)
+        key_ends = np.cumsum(rows["key"], dtype=np.int64) + keys_start
+        if (key_ends[-1] if count else keys_start) != len(data):
+            raise DecodeError("Atlas index keys do not match their lengths")
+
+        index, start = {}, keys_start
+        for end, x, y, length in zip(
+            key_ends.tolist(), rows["x"].tolist(), rows["y"].tolist(), rows["length"].tolist()
+        ):
+            index[data[start:end].decode("utf-8", "surrogatepass")] = (x, y, length)
+            start = end
+        return index
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def keys(self):
+        return self.index.keys()
+
+    def get(self, key: str) -> bytes:
+        """
+        Decode the payload stored under ``key``.
+        
+        Raises:
+            KeyError: If the atlas has no such key
+            ValueError: If the entry's pixel chain is broken
+        """
+        x, y, length = self.index[key]
+        data_channels, pointer_channel = self.codec._FORMATS[self.format_version]
+        count = max(1, -(-length // len(data_channels)))
+        height, width = self._rgba.shape[:2]
+
+        data = bytearray()
+        for step in range(count):
+            if not (0 <= x < width and 0 <= y < height) or not self._rgba[y, x, 3]:
+                raise BrokenChainError("Broken pointer chain - missing target pixel")
+            channels = self._rgba[y, x].tolist()
+            data.extend([channels[c] for c in data_channels])
+
+            pointer = channels[pointer_channel]
+            distance = pointer >> 2
+            if step == count - 1:
+                break
+            if not distance:
+                raise ValueError(f"Chain of entry {key!r} ends early")
+            dx, dy = self.codec._DIRS_DECODE[pointer & 0x03]
+            x, y = x + dx * distance, y + dy * distance
+
+        return bytes(data[:length])
+
+    def read_all(self) -> dict:
+        """
+        Decode every entry at once.
+        
+        Returns:
+            Mapping of every key to its payload
+        """
+        data_channels, pointer_channel = self.codec._FORMATS[self.format_version]
+        per_pixel = len(data_channels)
+        entries = list(self.index.items())
+
+        chains = self.codec._resolve_chains(
+            self._rgba,
+            [(x, y) for _, (x, y, _) in entries],
+            [max(1, -(-length // per_pixel)) for _, (_, _, length) in entries],
+            data_channels,
+            pointer_channel,
+        )
+        if chains is None:
+            # irregular canvas - follow the chains one by one
+            return {key: self.get(key) for key in self.index}
+
+        return {
+            key: chain[:length]
+            for (key, (_, _, length)), chain in zip(entries, chains)
+        }
+
+
+class ByteArtCodec:
+    """
+    Reusable codec instance with its own configuration, RNG and buffers.
+    
+    The PNGBytesCodec classmethods allocate every buffer per call and fall
+    back to the shared ``random`` module without a seed. An instance keeps
+    its format, PNG writer settings and limits, owns its RNG, and reuses
+    scratch buffers and a compression thread pool across calls, which
+    suits long-lived workers encoding many payloads.
+    
+    The scratch arena holds the walk's coordinate rows, the RGBA channel
+    rows, the canvas and the PNG scanlines, which cuts what each call
+    allocates and frees again. The walk's occupancy set of visited
+    positions is still built per call: it is a set of Python tuples that
+    clear() would free anyway. The walk dominates encode time at every
+    payload size, so reuse does not make encodes measurably faster.
+    
+    Instances are not thread-safe; give each thread its own.
+    """
+
+    def __init__(
+        self,
+        *,
+        format_version: int = PNGBytesCodec.FORMAT_LEGACY,
+        random_seed: int | None = None,
+        compress_level: int | None = None,
+        band_bytes: int | None = None,
+        max_workers: int | None = None,
+        max_canvas_pixels: int | None = None,
+        max_output_bytes: int | None = None,
+        time_budget: float | None = None,
+        codec=PNGBytesCodec,
+    ) -> None:
+        """
+        Args:
+            format_version: FORMAT_LEGACY or FORMAT_DENSE
+            random_seed: Seed of the instance RNG (None for OS entropy)
+            compress_level: zlib level (default codec.PNG_COMPRESS_LEVEL)
+            band_bytes: Bytes per deflate band (default codec.PNG_BAND_BYTES)
+            max_workers: Compression threads (default codec.PNG_WORKERS)
+            max_canvas_pixels: Largest canvas to encode or decode
+            max_output_bytes: Largest payload to decode
+            time_budget: Seconds allowed per decode
+            codec: Codec class providing the implementation
+        """
+        if format_version not in codec._FORMATS:
+            raise ValueError(f"Unsupported format version: {format_version}")
+
+        self.format_version = format_version
+        self.compress_level = compress_level
+        self.band_bytes = band_bytes
+        self.max_workers = max_workers
+        self.max_canvas_pixels = max_canvas_pixels
+        self.max_output_bytes = max_output_bytes
+        self.time_budget = time_budget
+        self.codec = codec
+
+        self.rng = random.Random(random_seed)
+        self.scratch = ScratchArena()
+        self._seeded_rng = random.Random()
+        self._pool: ThreadPoolExecutor | None = None
+
+    def encode_bytes(
+        self,
+        data: bytes,
+        output_path: str | Path,
+        *,
+        random_seed: int | None = None,
+    ) -> None:
+        """
+        Encode bytes as a PNG image.
+        
+        Args:
+            data: Raw bytes to encode
+            output_path: Where to save the PNG file
+            random_seed: Seed for this call (None draws from the instance RNG)
+        """
+        if random_seed is None:
+            rng = self.rng
+        else:
+            rng = self._seeded_rng
+            rng.seed(random_seed)
+
+        if self._pool is None:
+            workers = self.max_workers
+            if workers is None:
+                workers = self.codec.PNG_WORKERS
+            self._pool = ThreadPoolExecutor(max_workers=workers)
+
+        self.codec._encode_to_png(
+            data, output_path, rng, self.format_version,
+            scratch=self.scratch,
+            max_canvas_pixels=self.max_canvas_pixels,
+            compress_level=self.compress_level,
+            band_bytes=self.band_bytes,
+            pool=self._pool,
+        )
+
+    def encode_file(
+        self,
+        input_path: str | Path,
+        output_path: str | Path,
+        *,
+        random_seed: int | None = None,
+    ) -> None:
+        """Encode a file as a PNG image."""
+        with open(input_path, 'rb') as f:
+            data = f.read()
+
+        self.encode_bytes(data, output_path, random_seed=random_seed)
+
+    def encode_text(
+        self,
+        text: str,
+        output_path: str | Path,
+        *,
+        random_seed: int | None = None,
+    ) -> None:
+        """Encode text as a PNG image."""
+        data = text.encode("utf-8", "surrogatepass")
+        self.encode_bytes(data, output_path, random_seed=random_seed)
+
+    def decode_bytes(self, image_path: str | Path) -> bytes:
+        """Decode bytes from a PNG image, applying the instance limits."""
+        return self.codec.decode_bytes(
+            image_path,
+            max_canvas_pixels=self.max_canvas_pixels,
+            max_output_bytes=self.max_output_bytes,
+            time_budget=self.time_budget,
+        )
+
+    def decode_to_file(self, image_path: str | Path, output_path: str | Path) -> None:
+        """Decode bytes from PNG image and save to file."""
+        data = self.decode_bytes(image_path)
+        with open(output_path, 'wb') as f:
+            f.write(data)
+
+    def decode_text(self, image_path: str | Path) -> str:
+        """Decode text from a PNG image."""
+        return self.decode_bytes(image_path).decode("utf-8", "surrogatepass")
+
+    def close(self) -> None:
+        """Shut down the compression threads and release scratch buffers."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self.scratch.clear()
+
+    def __enter__(self) -> ByteArtCodec:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
 
 # alias
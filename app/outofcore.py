@@ -0,0 +1,338 @@
+"""
+Out-of-core encoding for PNGBytesCodec.
+
+The in-memory encoder keeps the set of used positions, every pixel and the
+whole canvas in RAM. OutOfCoreEncoder produces the same image while keeping
+memory bounded by a budget instead of the payload size: the input file is
+memory-mapped, occupancy lives in a disk-backed chunked bitmap, pixels
+spill to a temporary file in fixed-size blocks, and a final pass buckets
+them by row band and streams the PNG out band by band.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import random
+import shutil
+import tempfile
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from .codec import PNGBytesCodec
+
+
+class DiskOccupancyMap:
+    """
+    Set-like occupancy of (x, y) positions backed by a memory-mapped file.
+
+    The plane is cut into square tiles of ``2 ** tile_bits`` pixels a side,
+    one bit per pixel, allocated in the file as the walk reaches them.
+    Tiles are mapped in windows of ``window_bytes``; at most
+    ``max_windows`` are mapped at once and the least recently used one is
+    unmapped, its pages staying in the file.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        tile_bits: int = 9,
+        window_bytes: int = 1 << 20,
+        max_windows: int = 16,
+    ) -> None:
+        """
+        Args:
+            path: Backing file, created or truncated
+            tile_bits: log2 of the tile side
+            window_bytes: Bytes per mapping, a multiple of the page size
+                holding a whole number of tiles
+            max_windows: Mappings kept open at once
+        """
+        tile_bytes = max(1, (1 << 2 * tile_bits) // 8)
+        if window_bytes % mmap.ALLOCATIONGRANULARITY or window_bytes % tile_bytes:
+            raise ValueError(
+                "window_bytes must be a multiple of the page size and tile size"
+            )
+
+        self.tile_bits = tile_bits
+        self.window_bytes = window_bytes
+        self.max_windows = max(1, max_windows)
+        self.evictions = 0
+
+        self._mask = (1 << tile_bits) - 1
+        self._tile_bytes = tile_bytes
+        self._tiles_per_window = window_bytes // tile_bytes
+        self._slots: dict[tuple[int, int], int] = {}
+        self._windows: OrderedDict[int, mmap.mmap] = OrderedDict()
+        self._count = 0
+        self._file = open(path, 'w+b')
+
+    def __contains__(self, position) -> bool:
+        x, y = position
+        shift = self.tile_bits
+        slot = self._slots.get((x >> shift, y >> shift))
+        if slot is None:
+            return False
+        window, offset = self._locate(slot, x, y)
+        return bool(window[offset >> 3] >> (offset & 7) & 1)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, position) -> None:
+        x, y = position
+        shift = self.tile_bits
+        key = (x >> shift, y >> shift)
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = len(self._slots)
+            if not slot % self._tiles_per_window:
+                # new tiles start zeroed as the file grows
+                self._file.truncate((slot // self._tiles_per_window + 1) * self.window_bytes)
+        window, offset = self._locate(slot, x, y)
+        byte = window[offset >> 3]
+        bit = 1 << (offset & 7)
+        if not byte & bit:
+            window[offset >> 3] = byte | bit
+            self._count += 1
+
+    def close(self) -> None:
+        """Unmap every window and close the backing file."""
+        for window in self._windows.values():
+            window.close()
+        self._windows.clear()
+        self._file.close()
+
+    def _locate(self, slot: int, x: int, y: int) -> tuple[mmap.mmap, int]:
+        """Map the window of a tile slot and return it with the bit offset."""
+        index, tile = divmod(slot, self._tiles_per_window)
+        window = self._windows.get(index)
+        if window is None:
+            if len(self._windows) >= self.max_windows:
+                _, evicted = self._windows.popitem(last=False)
+                evicted.close()
+                self.evictions += 1
+            window = mmap.mmap(
+                self._file.fileno(), self.window_bytes,
+                offset=index * self.window_bytes,
+            )
+            self._windows[index] = window
+        elif index != next(reversed(self._windows)):
+            self._windows.move_to_end(index)
+
+        mask = self._mask
+        bit = ((y & mask) << self.tile_bits) | (x & mask)
+        return window, tile * self._tile_bytes * 8 + bit
+
+
+class OutOfCoreEncoder:
+    """
+    Encode files larger than memory into the same PNG as encode_file().
+
+    Peak memory is bounded by ``memory_budget`` rather than the payload:
+    half of it maps occupancy windows during the walk, and the final pass
+    rasterizes row bands sized to an eighth of it. Everything else spills
+    to ``work_dir``, which needs room for about 12 bytes per pixel twice
+    plus the occupancy bitmap.
+    """
+
+    # pixel records spilled during the walk
+    RECORD = np.dtype([("x", "<i4"), ("y", "<i4"), ("rgba", "u1", 4)])
+    BLOCK_PIXELS = 1 << 16
+
+    TILE_BITS = 9
+    WINDOW_BYTES = 1 << 20
+    MIN_MEMORY_BUDGET = 8 << 20
+
+    def __init__(
+        self,
+        *,
+        memory_budget: int = 256 << 20,
+        work_dir: str | Path | None = None,
+        codec=PNGBytesCodec,
+    ) -> None:
+        """
+        Args:
+            memory_budget: Bytes of buffers the encode may hold at once
+            work_dir: Directory for spill files (None for the system temp dir)
+            codec: Codec class defining the format
+
+        Raises:
+            ValueError: If the budget is below MIN_MEMORY_BUDGET
+        """
+        if memory_budget < self.MIN_MEMORY_BUDGET:
+            raise ValueError(
+                f"memory_budget must be at least {self.MIN_MEMORY_BUDGET} bytes"
+            )
+        self.memory_budget = memory_budget
+        self.work_dir = work_dir
+        self.codec = codec
+
+    def encode_file(
+        self,
+        input_path: str | Path,
+        output_path: str | Path,
+        *,
+        random_seed: int | None = None,
+        format_version: int = PNGBytesCodec.FORMAT_LEGACY,
+        compress_level: int | None = None,
+    ) -> None:
+        """
+        Encode a file as a PNG image without loading it into memory.
+
+        With a seed the pixels match codec.encode_file() exactly.
+
+        Args:
+            input_path: Path to the file to encode
+            output_path: Where to save the PNG file
+            random_seed: Seed for reproducible output (None for random)
+            format_version: FORMAT_LEGACY or FORMAT_DENSE
+            compress_level: zlib level (default codec.PNG_COMPRESS_LEVEL)
+
+        Raises:
+            ValueError: If the format is unknown, a legacy input is empty or
+                a canvas row does not fit the budget
+        """
+        codec = self.codec
+        if format_version not in codec._FORMATS:
+            raise ValueError(f"Unsupported format version: {format_version}")
+        data_channels, _ = codec._FORMATS[format_version]
+        per_pixel = len(data_channels)
+
+        length = os.path.getsize(input_path)
+        if format_version == codec.FORMAT_LEGACY and not length:
+            raise ValueError("Cannot encode empty data in the legacy format")
+        count = max(1, -(-length // per_pixel))
+
+        metadata = None
+        if format_version == codec.FORMAT_DENSE:
+            metadata = {"format": format_version, "length": length}
+
+        rng = random.Random(random_seed) if random_seed is not None else random
+        work_dir = Path(tempfile.mkdtemp(prefix="byteart-", dir=self.work_dir))
+        try:
+            with open(input_path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if length else b""
+            try:
+                bounds = self._walk_to_spill(
+                    data, length, count, rng, format_version, work_dir
+                )
+            finally:
+                if length:
+                    data.close()
+            self._rasterize_spill(
+                bounds, count, work_dir, output_path, metadata,
+                codec.PNG_COMPRESS_LEVEL if compress_level is None else compress_level,
+            )
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _walk_to_spill(self, data, length, count, rng, format_version, work_dir):
+        """Walk every pixel, spilling records in blocks; return the bounds."""
+        codec = self.codec
+        data_channels, pointer_channel = codec._FORMATS[format_version]
+        per_pixel = len(data_channels)
+        block = np.zeros(min(count, self.BLOCK_PIXELS), dtype=self.RECORD)
+
+        occupancy = DiskOccupancyMap(
+            work_dir / "occupancy.bin",
+            tile_bits=self.TILE_BITS,
+            window_bytes=self.WINDOW_BYTES,
+            max_windows=self.memory_budget // 2 // self.WINDOW_BYTES,
+        )
+        min_x = min_y = max_x = max_y = 0
+        try:
+            with open(work_dir / "pixels.bin", 'wb') as spill:
+                filled = written = 0
+                for x, y, pointer in codec._iter_walk(count, rng, occupancy):
+                    block["x"][filled] = x
+                    block["y"][filled] = y
+                    block["rgba"][filled, pointer_channel] = pointer
+                    filled += 1
+                    if filled < block.size and written + filled < count:
+                        continue
+
+                    records = block[:filled]
+                    min_x = min(min_x, int(records["x"].min()))
+                    max_x = max(max_x, int(records["x"].max()))
+                    min_y = min(min_y, int(records["y"].min()))
+                    max_y = max(max_y, int(records["y"].max()))
+
+                    # payload bytes of the block, zero padded at the end
+                    start = written * per_pixel
+                    chunk = np.zeros(filled * per_pixel, dtype=np.uint8)
+                    stop = min(length, start + chunk.size)
+                    if stop > start:
+                        chunk[:stop - start] = np.frombuffer(
+                            data, dtype=np.uint8, count=stop - start, offset=start
+                        )
+                    rgba = records["rgba"]
+                    rgba[:, list(data_channels)] = chunk.reshape(filled, per_pixel)
+                    if format_version == codec.FORMAT_DENSE:
+                        alpha = rgba[:, pointer_channel]
+                        alpha[alpha == 0] = codec._DENSE_EOF
+                    else:
+                        rgba[:, 3] = 255
+                    records.tofile(spill)
+                    written += filled
+                    filled = 0
+        finally:
+            occupancy.close()
+        return min_x, min_y, max_x, max_y
+
+    def _rasterize_spill(self, bounds, count, work_dir, output_path, metadata, level):
+        """Bucket spilled pixels by row band and stream the PNG band by band."""
+        codec = self.codec
+        min_x, min_y, max_x, max_y = bounds
+        width, height = max_x - min_x + 1, max_y - min_y + 1
+        row_bytes = width * 4 + 1
+        band_rows = (self.memory_budget // 8) // row_bytes
+        if not band_rows:
+            raise ValueError(
+                f"A canvas row of {width} pixels does not fit the memory budget"
+            )
+        bands = -(-height // band_rows)
+
+        # bucket pass: one spill file per row band
+        with open(work_dir / "pixels.bin", 'rb') as spill:
+            for _ in range(0, count, self.BLOCK_PIXELS):
+                records = np.fromfile(spill, dtype=self.RECORD, count=self.BLOCK_PIXELS)
+                band = (records["y"] - min_y) // band_rows
+                order = np.argsort(band, kind="stable")
+                records, band = records[order], band[order]
+                edges = np.flatnonzero(np.diff(band)) + 1
+                for start, stop in zip(
+                    np.concatenate(([0], edges)), np.concatenate((edges, [band.size]))
+                ):
+                    with open(work_dir / f"band_{band[start]}.bin", 'ab') as bucket:
+                        records[start:stop].tofile(bucket)
+        os.unlink(work_dir / "pixels.bin")
+
+        # streaming pass: rasterize each band and feed the deflate stream
+        compressor = zlib.compressobj(level)
+        scanlines = np.empty((band_rows, row_bytes), dtype=np.uint8)
+        with open(output_path, 'wb') as f:
+            f.write(codec._png_preamble(width, height, metadata, level))
+            for index in range(bands):
+                rows = min(band_rows, height - index * band_rows)
+                band = scanlines[:rows]
+                band[...] = 0
+                path = work_dir / f"band_{index}.bin"
+                if path.exists():
+                    records = np.fromfile(path, dtype=self.RECORD)
+                    os.unlink(path)
+                    canvas = band[:, 1:].reshape(rows, width, 4)
+                    canvas[
+                        records["y"] - min_y - index * band_rows,
+                        records["x"] - min_x,
+                    ] = records["rgba"]
+                    del records, canvas
+                deflated = compressor.compress(band)
+                if deflated:
+                    f.write(codec._png_chunk(b"IDAT", deflated))
+            f.write(codec._png_chunk(b"IDAT", compressor.flush()))
+            f.write(codec._png_chunk(b"IEND", b""))
@@ -0,0 +1,127 @@
+"""
+Benchmark: cost of the decoder's resource guards, plus a fuzz run.
+
+    python benchmarks/bench_decode_guards.py [rounds] [payload_size]
+
+First valid images are decoded with and without limits, which should cost
+the same. Then the pointer channel of valid images is corrupted at random
+and every mutant is decoded under tight limits; each must fail with a
+DecodeError subclass (or decode) within the time budget, never hang.
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, PngImagePlugin
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.codec import DecodeError, PNGBytesCodec  # noqa: E402
+
+TIME_BUDGET = 2.0
+
+
+def time_decode(image_path, rounds, **limits):
+    """Best of five batches, per decode."""
+    best = float("inf")
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            PNGBytesCodec.decode_bytes(image_path, **limits)
+        best = min(best, time.perf_counter() - started)
+    return best / rounds
+
+
+def close_loop(rgba, pointer_channel, rng):
+    """Point the EOF pixel back at another pixel of the chain: a cycle."""
+    height, width = rgba.shape[:2]
+    opaque = rgba[..., 3] != 0
+    eof = opaque & (rgba[..., pointer_channel] >> 2 == 0)
+    y, x = (int(v) for v in np.argwhere(eof)[0])
+    for direction in rng.sample(range(4), 4):
+        dx, dy = PNGBytesCodec._DIRS_DECODE[direction]
+        for distance in range(1, PNGBytesCodec.MAX_DISTANCE + 1):
+            tx, ty = x + dx * distance, y + dy * distance
+            if 0 <= tx < width and 0 <= ty < height and opaque[ty, tx]:
+                rgba[y, x, pointer_channel] = (distance << 2) | direction
+                return
+
+
+def mutate(rgba, pointer_channel, rng):
+    """Overwrite a few pointers with random values, or close the chain."""
+    rgba = rgba.copy()
+    if rng.random() < 0.5:
+        close_loop(rgba, pointer_channel, rng)
+        return rgba
+
+    ys, xs = np.nonzero(rgba[..., 3])
+    for _ in range(rng.randint(1, 4)):
+        i = rng.randrange(len(xs))
+        rgba[ys[i], xs[i], pointer_channel] = rng.randrange(
+            2 if pointer_channel == 3 else 0, 256
+        )
+    return rgba
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        image_path = Path(temp_dir) / "valid.png"
+        mutant_path = Path(temp_dir) / "mutant.png"
+
+        for format_version in PNGBytesCodec._FORMATS:
+            data = os.urandom(size)
+            PNGBytesCodec.encode_bytes(
+                data, image_path, random_seed=1, format_version=format_version
+            )
+            limits = {
+                "max_canvas_pixels": 1 << 26,
+                "max_output_bytes": 1 << 30,
+                "time_budget": 60.0,
+            }
+            bare = time_decode(image_path, 20)
+            guarded = time_decode(image_path, 20, **limits)
+            print(
+                f"format {format_version}: {bare * 1e3:7.2f} ms bare, "
+                f"{guarded * 1e3:7.2f} ms guarded ({(guarded / bare - 1) * 100:+.1f}%)"
+            )
+
+            # mutants keep the byteart text chunks, so the format is detected
+            pnginfo = PngImagePlugin.PngInfo()
+            with Image.open(image_path) as img:
+                rgba = np.asarray(img.convert("RGBA"))
+                for key, value in img.text.items():
+                    pnginfo.add_text(key, value)
+            _, pointer_channel = PNGBytesCodec._FORMATS[format_version]
+
+            outcomes = Counter()
+            slowest = 0.0
+            for _ in range(rounds):
+                mutant = mutate(rgba, pointer_channel, rng)
+                Image.fromarray(mutant, "RGBA").save(mutant_path, pnginfo=pnginfo)
+                started = time.perf_counter()
+                try:
+                    PNGBytesCodec.decode_bytes(
+                        mutant_path, max_output_bytes=4 * size, time_budget=TIME_BUDGET
+                    )
+                    outcomes["decoded"] += 1
+                except DecodeError as error:
+                    outcomes[type(error).__name__] += 1
+                slowest = max(slowest, time.perf_counter() - started)
+
+            print(f"  {rounds} mutants, slowest {slowest * 1e3:.1f} ms:")
+            for name, count in outcomes.most_common():
+                print(f"    {name:<22} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark: many same-length records encoded with one seed, plain versus
+through a LayoutCache.
+
+    python benchmarks/bench_layout_cache.py [count] [record_size]
+
+Every plain encode repeats the same seeded walk; the cached run walks
+once and then only scatters each record into the layout's template. Both
+runs must write identical files.
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.cache import LayoutCache  # noqa: E402
+from app.codec import PNGBytesCodec  # noqa: E402
+
+SEED = 42
+
+
+def run(label, encode, records, output_dir):
+    started = time.perf_counter()
+    for index, record in enumerate(records):
+        encode(record, output_dir / f"{index}.png", random_seed=SEED)
+    elapsed = time.perf_counter() - started
+    per_call = elapsed / len(records) * 1e6
+    print(f"{label:<8} {elapsed:8.3f} s  {per_call:8.1f} us/record")
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+    records = [os.urandom(size) for _ in range(count)]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        plain_dir = Path(temp_dir) / "plain"
+        cached_dir = Path(temp_dir) / "cached"
+        plain_dir.mkdir()
+        cached_dir.mkdir()
+
+        print(f"{count} records of {size} bytes, seed {SEED}")
+        for format_version in PNGBytesCodec._FORMATS:
+            print(f"format {format_version}:")
+            plain = run(
+                "plain",
+                lambda *a, **k: PNGBytesCodec.encode_bytes(
+                    *a, format_version=format_version, **k
+                ),
+                records, plain_dir,
+            )
+            cache = LayoutCache()
+            cached = run(
+                "cached",
+                lambda *a, **k: cache.encode_bytes(
+                    *a, format_version=format_version, **k
+                ),
+                records, cached_dir,
+            )
+            print(f"  speedup {plain / cached:.1f}x")
+
+            for index in range(count):
+                name = f"{index}.png"
+                if (plain_dir / name).read_bytes() != (cached_dir / name).read_bytes():
+                    raise SystemExit(f"record {index} differs")
+            print("  outputs identical")
+
+
+if __name__ == "__main__":
+    main()
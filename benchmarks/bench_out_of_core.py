@@ -0,0 +1,64 @@
+"""
+Benchmark: peak RSS of the in-memory encoder versus OutOfCoreEncoder.
+
+    python benchmarks/bench_out_of_core.py [payload_size] [memory_budget]
+
+Each encode runs in a fresh interpreter so ru_maxrss only covers that
+encode. The baseline row is an interpreter that imports the codec and
+does nothing else.
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.codec import PNGBytesCodec  # noqa: E402
+from app.outofcore import OutOfCoreEncoder  # noqa: E402
+
+SEED = 1  # reaches several hundred thousand pixels without dead-ending
+
+
+def child(mode, input_path, output_path, budget):
+    started = time.perf_counter()
+    if mode == "in-memory":
+        PNGBytesCodec.encode_file(input_path, output_path, random_seed=SEED)
+    elif mode == "out-of-core":
+        OutOfCoreEncoder(memory_budget=budget).encode_file(
+            input_path, output_path, random_seed=SEED
+        )
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+    print(f"{elapsed} {peak}")
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 400_000
+    budget = int(sys.argv[2]) if len(sys.argv) > 2 else 16 << 20
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_path = Path(temp_dir) / "input.bin"
+        input_path.write_bytes(os.urandom(size))
+        print(f"{size} byte payload, {budget >> 20} MiB budget")
+
+        for mode in ("baseline", "in-memory", "out-of-core"):
+            output_path = Path(temp_dir) / f"{mode}.png"
+            result = subprocess.run(
+                [sys.executable, __file__, "--child", mode,
+                 str(input_path), str(output_path), str(budget)],
+                check=True, capture_output=True, text=True,
+            )
+            elapsed, peak = result.stdout.split()
+            print(f"{mode:<12} {float(elapsed):7.2f} s  peak RSS {int(peak) / 1024:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child(sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5]))
+    else:
+        main()
@@ -0,0 +1,73 @@
+"""
+Benchmark: many small encodes through the classmethod API versus one
+reused ByteArtCodec instance.
+
+    python benchmarks/bench_reuse.py [count] [payload_size]
+
+Both runs use the same seeds, so they do identical walks. The walk
+dominates the time of a small encode, so the two run at about the same
+speed; the instance differs in churn (memory allocated and freed again
+within a call), since its scratch buffers are kept between calls.
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.codec import ByteArtCodec, PNGBytesCodec  # noqa: E402
+
+
+def run(label, encode, payloads, output_path):
+    started = time.perf_counter()
+    for seed, payload in enumerate(payloads):
+        encode(payload, output_path, random_seed=seed)
+    elapsed = time.perf_counter() - started
+
+    # separate pass, tracing slows every allocation down; each call's peak
+    # above the memory live before it is what the call churns through
+    calls = payloads[:50]
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    churn = 0
+    for seed, payload in enumerate(calls):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        encode(payload, output_path, random_seed=seed)
+        churn += tracemalloc.get_traced_memory()[1] - before
+    retained = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    per_call = elapsed / len(payloads) * 1e6
+    print(
+        f"{label:<12} {elapsed:8.3f} s  {per_call:8.1f} us/call  "
+        f"churn {churn / len(calls) / 1024:7.1f} KiB/call  "
+        f"retained {retained / 1024:7.1f} KiB"
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    payloads = [os.urandom(size) for _ in range(count)]
+
+    print(f"{count} payloads of {size} bytes")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_path = Path(temp_dir) / "bench.png"
+
+        run("classmethod", PNGBytesCodec.encode_bytes, payloads, output_path)
+
+        with ByteArtCodec() as codec:
+            run("instance", codec.encode_bytes, payloads, output_path)
+            print(
+                f"instance scratch: {codec.scratch.allocations} buffer allocations "
+                f"for {count} calls, {codec.scratch.nbytes / 1024:.1f} KiB retained"
+            )
+
+
+if __name__ == "__main__":
+    main()
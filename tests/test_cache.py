@@ -0,0 +1,280 @@
+"""
+Unit tests for CodecCache and LayoutCache using pytest.
+"""
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from app.cache import CodecCache, LayoutCache
+from app.codec import PNGBytesCodec
+
+
+class CountingCodec(PNGBytesCodec):
+    """Codec subclass counting the calls that reach it."""
+
+    encodes = 0
+    decodes = 0
+
+    @classmethod
+    def encode_bytes(cls, *args, **kwargs):
+        CountingCodec.encodes += 1
+        return super().encode_bytes(*args, **kwargs)
+
+    @classmethod
+    def decode_bytes(cls, *args, **kwargs):
+        CountingCodec.decodes += 1
+        return super().decode_bytes(*args, **kwargs)
+
+    walks = 0
+
+    @classmethod
+    def walk_layout(cls, *args, **kwargs):
+        CountingCodec.walks += 1
+        return super().walk_layout(*args, **kwargs)
+
+
+class TestCodecCache:
+    """Test suite for CodecCache."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.cache_dir = self.temp_dir / "cache"
+        self.image_path = self.temp_dir / "test.png"
+        CountingCodec.encodes = CountingCodec.decodes = CountingCodec.walks = 0
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_seeded_encode_hits_memory(self):
+        """Test that a repeated seeded encode reuses the cached image."""
+        cache = CodecCache(codec=CountingCodec)
+        other_path = self.temp_dir / "other.png"
+
+        cache.encode_bytes(b"payload", self.image_path, random_seed=1)
+        cache.encode_bytes(b"payload", other_path, random_seed=1)
+
+        assert CountingCodec.encodes == 1
+        assert cache.stats.memory_hits == 1
+        assert cache.stats.misses == 1
+        assert other_path.read_bytes() == self.image_path.read_bytes()
+
+    def test_encode_parameters_are_part_of_key(self):
+        """Test that different seeds or formats miss the cache."""
+        cache = CodecCache(codec=CountingCodec)
+
+        cache.encode_bytes(b"payload", self.image_path, random_seed=1)
+        cache.encode_bytes(b"payload", self.image_path, random_seed=2)
+        cache.encode_bytes(
+            b"payload", self.image_path,
+            random_seed=2, format_version=PNGBytesCodec.FORMAT_DENSE,
+        )
+
+        assert CountingCodec.encodes == 3
+        assert cache.stats.hits == 0
+
+    def test_unseeded_encode_bypasses_cache(self):
+        """Test that random encodes are never served from the cache."""
+        cache = CodecCache(codec=CountingCodec)
+
+        cache.encode_bytes(b"payload", self.image_path)
+        cache.encode_bytes(b"payload", self.image_path)
+
+        assert CountingCodec.encodes == 2
+        assert cache.stats.hits == cache.stats.misses == 0
+
+    def test_decode_shared_through_disk(self):
+        """Test that a second cache instance reads the disk tier."""
+        PNGBytesCodec.encode_bytes(b"shared", self.image_path, random_seed=3)
+
+        first = CodecCache(self.cache_dir, codec=CountingCodec)
+        second = CodecCache(self.cache_dir, codec=CountingCodec)
+
+        assert first.decode_bytes(self.image_path) == b"shared"
+        assert second.decode_bytes(self.image_path) == b"shared"
+        assert CountingCodec.decodes == 1
+        assert second.stats.disk_hits == 1
+        assert second.stats.hit_rate == 1.0
+
+    def test_disk_size_cap_evicts_oldest(self):
+        """Test that the disk tier stays under its size cap."""
+        cache = CodecCache(self.cache_dir, memory_items=0, disk_bytes=3000)
+        payloads = [os.urandom(1000) for _ in range(5)]
+
+        for index, payload in enumerate(payloads):
+            path = self.temp_dir / f"{index}.png"
+            PNGBytesCodec.encode_bytes(payload, path, random_seed=index)
+            os.utime(path)
+            cache.decode_bytes(path)
+
+        sizes = [p.stat().st_size for p in self.cache_dir.glob("??/*")]
+        assert sum(sizes) <= 3000
+        assert cache.stats.evictions == 5 - len(sizes)
+
+    def test_disk_writes_do_not_rescan(self):
+        """Test that the disk tier is listed once, not on every write."""
+        cache = CodecCache(self.cache_dir, memory_items=0)
+        scans = []
+        disk_entries = cache._disk_entries
+        cache._disk_entries = lambda: scans.append(1) or disk_entries()
+
+        for seed in range(20):
+            cache.encode_bytes(b"payload", self.image_path, random_seed=seed)
+
+        assert len(scans) == 1
+
+    def test_writer_settings_are_part_of_key(self):
+        """Test that changing the PNG writer settings misses the cache."""
+        class FastCodec(PNGBytesCodec):
+            PNG_COMPRESS_LEVEL = 1
+
+        CodecCache(self.cache_dir).encode_bytes(
+            b"payload" * 50, self.image_path, random_seed=1
+        )
+        cache = CodecCache(self.cache_dir, codec=FastCodec)
+        cache.encode_bytes(b"payload" * 50, self.image_path, random_seed=1)
+
+        assert cache.stats.misses == 1
+        assert cache.stats.disk_hits == 0
+
+    def test_walk_rules_are_part_of_key(self):
+        """Test that changing the walk's step rules misses the cache."""
+        class ShortStepCodec(PNGBytesCodec):
+            MAX_DISTANCE = 3
+
+        CodecCache(self.cache_dir).encode_bytes(
+            b"payload" * 50, self.image_path, random_seed=1
+        )
+        cache = CodecCache(self.cache_dir, codec=ShortStepCodec)
+        cache.encode_bytes(b"payload" * 50, self.image_path, random_seed=1)
+
+        assert cache.stats.misses == 1
+        assert cache.stats.disk_hits == 0
+        assert ShortStepCodec.decode_bytes(self.image_path) == b"payload" * 50
+
+    def test_expands_user_dir(self, monkeypatch):
+        """Test that a leading ~ in cache_dir is the home directory."""
+        monkeypatch.setenv("HOME", str(self.temp_dir))
+
+        cache = CodecCache("~/byteart-cache")
+
+        assert cache.cache_dir == self.temp_dir / "byteart-cache"
+        assert cache.cache_dir.is_dir()
+
+    def test_clear(self):
+        """Test that clear() empties both tiers."""
+        cache = CodecCache(self.cache_dir, codec=CountingCodec)
+        PNGBytesCodec.encode_bytes(b"clear me", self.image_path, random_seed=3)
+
+        cache.decode_bytes(self.image_path)
+        cache.clear()
+        cache.decode_bytes(self.image_path)
+
+        assert CountingCodec.decodes == 2
+        assert not any(
+            p.suffix == ".tmp" for p in self.cache_dir.rglob("*")
+        )
+
+
+class TestLayoutCache:
+    """Test suite for LayoutCache."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.cache_dir = self.temp_dir / "cache"
+        self.image_path = self.temp_dir / "test.png"
+        self.reference_path = self.temp_dir / "reference.png"
+        CountingCodec.encodes = CountingCodec.decodes = CountingCodec.walks = 0
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.parametrize("format_version", [
+        PNGBytesCodec.FORMAT_LEGACY, PNGBytesCodec.FORMAT_DENSE,
+    ])
+    def test_matches_encode_bytes(self, format_version):
+        """Test that records sharing a layout encode exactly like encode_bytes()."""
+        cache = LayoutCache(codec=CountingCodec)
+
+        for _ in range(3):
+            data = os.urandom(1000) + b"\x01"
+            cache.encode_bytes(
+                data, self.image_path, random_seed=5, format_version=format_version
+            )
+            PNGBytesCodec.encode_bytes(
+                data, self.reference_path, random_seed=5, format_version=format_version
+            )
+            assert self.image_path.read_bytes() == self.reference_path.read_bytes()
+            assert PNGBytesCodec.decode_bytes(self.image_path) == data
+
+        assert CountingCodec.walks == 1
+        assert cache.stats.memory_hits == 2
+
+    def test_scratch_buffers_are_reused(self):
+        """Test that cache hits encode into the same scratch buffers."""
+        cache = LayoutCache()
+        cache.encode_bytes(os.urandom(600), self.image_path, random_seed=3)
+        allocations = cache.scratch.allocations
+
+        for _ in range(5):
+            cache.encode_bytes(os.urandom(600), self.image_path, random_seed=3)
+
+        assert allocations > 0
+        assert cache.scratch.allocations == allocations
+
+    def test_lengths_share_pixel_count(self):
+        """Test that lengths needing the same pixels share one layout."""
+        cache = LayoutCache(codec=CountingCodec)
+        dense = PNGBytesCodec.FORMAT_DENSE
+
+        for length in (298, 299, 300):
+            cache.layout(length, random_seed=1, format_version=dense)
+        cache.layout(301, random_seed=1, format_version=dense)
+        cache.layout(300, random_seed=2, format_version=dense)
+
+        assert CountingCodec.walks == 3
+
+    def test_disk_tier_shared(self):
+        """Test that a second cache loads the layout from disk."""
+        LayoutCache(self.cache_dir).encode_text(
+            "first record", self.reference_path, random_seed=7
+        )
+        cache = LayoutCache(self.cache_dir, codec=CountingCodec)
+        cache.encode_text("other record", self.image_path, random_seed=7)
+
+        assert CountingCodec.walks == 0
+        assert cache.stats.disk_hits == 1
+        assert PNGBytesCodec.decode_text(self.image_path) == "other record"
+
+    def test_unseeded_bypasses_cache(self):
+        """Test that unseeded encodes never touch the cache."""
+        cache = LayoutCache(self.cache_dir, codec=CountingCodec)
+
+        cache.encode_bytes(b"random walk", self.image_path)
+
+        assert CountingCodec.encodes == 1
+        assert cache.stats.misses == 0
+        assert list(self.cache_dir.iterdir()) == []
+
+    def test_layout_errors(self):
+        """Test rejected layouts and payloads."""
+        cache = LayoutCache()
+        layout = cache.layout(100, random_seed=1)
+
+        with pytest.raises(ValueError, match="Layout is for 50 pixels"):
+            PNGBytesCodec.encode_with_layout(b"x" * 10, layout, self.image_path)
+        with pytest.raises(ValueError, match="empty data"):
+            cache.layout(0, random_seed=1)
+        with pytest.raises(ValueError, match="Unsupported format"):
+            cache.layout(10, random_seed=1, format_version=9)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,74 @@
+"""
+Unit tests for the command-line tools using pytest.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# cli.py is run from inside app/ and imports the codec as a top-level module
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+import cli  # noqa: E402
+
+
+class TestPlanCommand:
+    """Test suite for the plan command."""
+
+    def test_prints_plan(self, capsys):
+        """Test that an accepted payload prints the plan and exits 0."""
+        assert cli.main(["plan", "5000", "--seed", "3"]) == 0
+
+        out = capsys.readouterr().out
+        plan = cli.PNGBytesCodec.plan(5000, random_seed=3)
+        assert "Payload:        5000 bytes" in out
+        assert f"Canvas:         {plan.width} x {plan.height}" in out
+        assert "Geometry" not in out
+
+    def test_unseeded_plan_is_estimated(self, capsys):
+        """Test that a plan without a seed says it is an estimate."""
+        assert cli.main(["plan", "100000000", "--dense"]) == 0
+
+        assert "Geometry:       95th percentile estimate" in capsys.readouterr().out
+
+    def test_unseeded_limit_is_conservative(self, capsys):
+        """Test that an unseeded plan rejects canvases a typical walk exceeds."""
+        # 1000 pixels: the mean walk needs about 3500, but many exceed 4500
+        assert cli.main(["plan", "2000", "--max-pixels", "4500"]) == 1
+        assert "Rejected: canvas exceeds 4500 pixels" in capsys.readouterr().err
+
+    def test_rejects_canvas(self, capsys):
+        """Test that --max-pixels rejects a larger canvas and stops the walk."""
+        assert cli.main(["plan", "200000", "--seed", "1", "--max-pixels", "1000"]) == 1
+
+        captured = capsys.readouterr()
+        assert "lower bound" in captured.out
+        assert "Fill ratio" not in captured.out
+        assert "Rejected: canvas exceeds 1000 pixels" in captured.err
+
+    def test_rejects_memory(self, capsys):
+        """Test that --max-memory rejects a higher peak memory."""
+        assert cli.main(["plan", "5000", "--max-memory", "1000"]) == 1
+
+        captured = capsys.readouterr()
+        assert "Rejected: memory exceeds 1000 bytes" in captured.err
+        assert "canvas" not in captured.err
+
+    def test_accepts_within_limits(self, capsys):
+        """Test that a payload within every limit is admitted."""
+        argv = ["plan", "5000", "--max-pixels", "100000", "--max-memory", str(1 << 30)]
+
+        assert cli.main(argv) == 0
+        assert capsys.readouterr().err == ""
+
+    def test_rejects_dead_end(self, capsys, monkeypatch):
+        """Test that a seed whose walk dead-ends is rejected, not a traceback."""
+        monkeypatch.setattr(cli.PNGBytesCodec, "MAX_DISTANCE", 1)
+
+        assert cli.main(["plan", "200000", "--seed", "1"]) == 1
+        assert "Rejected: Walk with seed 1 dead-ends" in capsys.readouterr().err
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
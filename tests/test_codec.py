@@ -1 +1,1085 @@
+"""
+Unit tests for PNGBytesCodec using pytest.
+"""
 
+import json
+import os
+import random
+import shutil
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image, PngImagePlugin
+
+from app.codec import (
+    ByteArtCodec,
+    CanvasTooLargeError,
+    DecodeError,
+    DecodeTimeoutError,
+    OutputTooLargeError,
+    PNGBytesCodec,
+    PointerCycleError,
+    ScratchArena,
+    WalkDeadEndError,
+)
+
+
+class TestPNGBytesCodec:
+    """Test suite for PNGBytesCodec."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_image_path = Path(self.temp_dir) / "test.png"
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_encode_decode_bytes(self):
+        """Test basic round trip of binary data."""
+        data = bytes(range(256)) * 4
+
+        PNGBytesCodec.encode_bytes(data, self.test_image_path, random_seed=42)
+
+        assert PNGBytesCodec.decode_bytes(self.test_image_path) == data
+
+    def test_encode_decode_text(self):
+        """Test round trip through the text helpers."""
+        text = "Hello, 世界! 🌍"
+
+        PNGBytesCodec.encode_text(text, self.test_image_path, random_seed=42)
+
+        assert PNGBytesCodec.decode_text(self.test_image_path) == text
+
+
+class TestChainResolver:
+    """Test suite for the vectorized chain resolver."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_image_path = Path(self.temp_dir) / "test.png"
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    def _canvas(self, pixels, size=(8, 8)):
+        """Build an RGBA array from (x, y, r, g, b) tuples."""
+        rgba = np.zeros((size[1], size[0], 4), dtype=np.uint8)
+        for x, y, r, g, b in pixels:
+            rgba[y, x] = (r, g, b, 255)
+        return rgba
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_matches_scalar_walk(self, seed):
+        """Test that list ranking yields the same bytes as the scalar walk."""
+        PNGBytesCodec.encode_bytes(os.urandom(4000), self.test_image_path, random_seed=seed)
+        pixel_data = PNGBytesCodec._load_pixel_data(self.test_image_path)
+        start = PNGBytesCodec._find_start_pixel(pixel_data)
+        expected = bytes(PNGBytesCodec._extract_bytes(pixel_data, start))
+
+        with Image.open(self.test_image_path) as img:
+            rgba = np.asarray(img.convert("RGBA"))
+
+        assert PNGBytesCodec._resolve_chain(rgba) == expected
+
+    def test_single_pixel(self):
+        """Test a chain consisting only of the EOF pixel."""
+        rgba = self._canvas([(0, 0, 1, 0, 2)])
+
+        assert PNGBytesCodec._resolve_chain(rgba) == b"\x01\x02"
+
+    def test_detached_cycle_falls_back(self):
+        """Test that a stray cycle is left to the scalar walk."""
+        right, left = (1 << 2) | 0b00, (1 << 2) | 0b01
+        rgba = self._canvas([
+            (0, 0, 65, right, 66), (1, 0, 67, 0, 68),    # chain "ABCD"
+            (0, 2, 1, right, 1), (1, 2, 2, left, 2),     # detached cycle
+        ])
+        Image.fromarray(rgba, "RGBA").save(self.test_image_path)
+
+        assert PNGBytesCodec._resolve_chain(rgba) is None
+        assert PNGBytesCodec.decode_bytes(self.test_image_path) == b"ABCD"
+
+    def test_broken_chain_still_reported(self):
+        """Test that a pointer into a transparent pixel raises ValueError."""
+        down = (3 << 2) | 0b10
+        rgba = self._canvas([(0, 0, 65, down, 66)])
+        Image.fromarray(rgba, "RGBA").save(self.test_image_path)
+
+        assert PNGBytesCodec._resolve_chain(rgba) is None
+        with pytest.raises(ValueError, match="Broken pointer chain"):
+            PNGBytesCodec.decode_bytes(self.test_image_path)
+
+
+class TestDecodeLimits:
+    """Test suite for the decoder's guards against untrusted images."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_image_path = Path(self.temp_dir) / "test.png"
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_pointer_cycle(self):
+        """Test that a chain looping back on itself fails instead of growing."""
+        right, left = (1 << 2) | 0b00, (1 << 2) | 0b01
+        rgba = np.zeros((4, 4, 4), dtype=np.uint8)
+        rgba[0, 0] = (65, right, 66, 255)
+        rgba[0, 1] = (67, right, 68, 255)
+        rgba[0, 2] = (69, left, 70, 255)
+        Image.fromarray(rgba, "RGBA").save(self.test_image_path)
+
+        with pytest.raises(PointerCycleError, match="loops back"):
+            PNGBytesCodec.decode_bytes(self.test_image_path)
+
+    def test_canvas_limit(self):
+        """Test that large canvases are rejected before loading."""
+        PNGBytesCodec.encode_bytes(os.urandom(500), self.test_image_path, random_seed=1)
+
+        with pytest.raises(CanvasTooLargeError):
+            PNGBytesCodec.decode_bytes(self.test_image_path, max_canvas_pixels=10)
+
+    @pytest.mark.parametrize("format_version", [
+        PNGBytesCodec.FORMAT_LEGACY, PNGBytesCodec.FORMAT_DENSE,
+    ])
+    def test_output_limit(self, format_version):
+        """Test that oversized payloads are rejected before the walk."""
+        data = os.urandom(599) + b"\x01"  # legacy strips trailing zeros
+        PNGBytesCodec.encode_bytes(
+            data, self.test_image_path,
+            random_seed=1, format_version=format_version,
+        )
+
+        with pytest.raises(OutputTooLargeError):
+            PNGBytesCodec.decode_bytes(self.test_image_path, max_output_bytes=599)
+        assert PNGBytesCodec.decode_bytes(
+            self.test_image_path, max_output_bytes=602, time_budget=60
+        ) == data
+
+    def test_output_limit_ignores_forged_length(self):
+        """Test that a small recorded length does not hide a large chain."""
+        PNGBytesCodec.encode_bytes(
+            os.urandom(3000), self.test_image_path,
+            random_seed=1, format_version=PNGBytesCodec.FORMAT_DENSE,
+        )
+        pnginfo = PngImagePlugin.PngInfo()
+        with Image.open(self.test_image_path) as img:
+            rgba = np.asarray(img.convert("RGBA"))
+            for key, value in img.text.items():
+                pnginfo.add_text(key, "1" if key == "byteart:length" else value)
+        Image.fromarray(rgba, "RGBA").save(self.test_image_path, pnginfo=pnginfo)
+
+        with pytest.raises(OutputTooLargeError, match="3000 bytes"):
+            PNGBytesCodec.decode_bytes(self.test_image_path, max_output_bytes=100)
+
+    @pytest.mark.parametrize("format_version", [
+        PNGBytesCodec.FORMAT_LEGACY, PNGBytesCodec.FORMAT_DENSE,
+    ])
+    def test_rejects_forged_long_length(self, format_version):
+        """Test that a chain shorter than the recorded length is an error."""
+        PNGBytesCodec.encode_bytes(
+            b"short payload", self.test_image_path,
+            random_seed=1, format_version=format_version, optimize=True,
+            optimize_seeds=1,
+        )
+        pnginfo = PngImagePlugin.PngInfo()
+        with Image.open(self.test_image_path) as img:
+            rgba = np.asarray(img.convert("RGBA"))
+            for key, value in img.text.items():
+                pnginfo.add_text(key, "1000" if key == "byteart:length" else value)
+        Image.fromarray(rgba, "RGBA").save(self.test_image_path, pnginfo=pnginfo)
+
+        with pytest.raises(DecodeError, match="shorter than its recorded length"):
+            PNGBytesCodec.decode_bytes(self.test_image_path)
+
+    def test_time_budget(self):
+        """Test that an exhausted time budget stops the decode."""
+        PNGBytesCodec.encode_bytes(os.urandom(500), self.test_image_path, random_seed=1)
+
+        with pytest.raises(DecodeTimeoutError):
+            PNGBytesCodec.decode_bytes(self.test_image_path, time_budget=0)
+
+    def test_errors_are_value_errors(self):
+        """Test that the specific errors stay catchable as ValueError."""
+        Image.new("RGBA", (4, 4)).save(self.test_image_path)
+
+        with pytest.raises(DecodeError, match="No payload"):
+            PNGBytesCodec.decode_bytes(self.test_image_path)
+        assert issubclass(PointerCycleError, ValueError)
+        assert issubclass(DecodeTimeoutError, ValueError)
+
+
+class TestPNGWriter:
+    """Test suite for the banded parallel PNG writer."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_image_path = Path(self.temp_dir) / "test.png"
+        rng = np.random.default_rng(0)
+        mask = rng.random((120, 75, 1)) < 0.3
+        self.rgba = (mask * rng.integers(0, 256, (120, 75, 4))).astype(np.uint8)
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    def _chunks(self):
+        """Parse (type, payload) of every chunk, checking each CRC."""
+        raw = self.test_image_path.read_bytes()
+        assert raw[:8] == b"\x89PNG\r\n\x1a\n"
+        offset, chunks = 8, []
+        while offset < len(raw):
+            (length,) = struct.unpack(">I", raw[offset:offset + 4])
+            chunk_type = raw[offset + 4:offset + 8]
+            payload = raw[offset + 8:offset + 8 + length]
+            (crc,) = struct.unpack(">I", raw[offset + 8 + length:offset + 12 + length])
+            assert crc == zlib.crc32(chunk_type + payload)
+            chunks.append((chunk_type, payload))
+            offset += 12 + length
+        return chunks
+
+    @pytest.mark.parametrize("band_bytes", [1, 1000, 1 << 20])
+    @pytest.mark.parametrize("compress_level", [0, 1, 6, 9])
+    def test_readable_by_pillow(self, band_bytes, compress_level):
+        """Test that any band size and level gives a standard PNG."""
+        PNGBytesCodec._write_png(
+            self.test_image_path, self.rgba,
+            compress_level=compress_level, band_bytes=band_bytes, max_workers=4,
+        )
+
+        with Image.open(self.test_image_path) as img:
+            assert img.format == "PNG"
+            assert img.mode == "RGBA"
+            assert np.array_equal(np.asarray(img), self.rgba)
+
+    def test_bands_form_one_zlib_stream(self):
+        """Test that the IDAT chunks concatenate into one valid stream."""
+        PNGBytesCodec._write_png(
+            self.test_image_path, self.rgba, metadata={"k": "v"}, band_bytes=3000
+        )
+
+        chunks = self._chunks()
+        idat = b"".join(payload for kind, payload in chunks if kind == b"IDAT")
+        scanlines = zlib.decompress(idat)
+
+        assert [kind for kind, _ in chunks][:2] == [b"IHDR", b"tEXt"]
+        assert chunks[-1] == (b"IEND", b"")
+        assert sum(kind == b"IDAT" for kind, _ in chunks) > 1
+        assert len(scanlines) == 120 * (75 * 4 + 1)
+
+    def test_small_image_window(self):
+        """Test that a lone small band deflates as a whole-window stream would."""
+        rgba = self.rgba[:10]
+        PNGBytesCodec._write_png(self.test_image_path, rgba, compress_level=9)
+
+        idat = b"".join(payload for kind, payload in self._chunks() if kind == b"IDAT")
+        scanlines = zlib.decompress(idat)
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        whole_window = compressor.compress(scanlines) + compressor.flush()
+
+        assert scanlines[1:301] == rgba[0].tobytes()
+        assert idat[2:-4] == whole_window
+
+    def test_metadata_and_decoding(self):
+        """Test that encoded images keep their text chunks and decode."""
+        PNGBytesCodec.encode_bytes(
+            b"written by the band writer", self.test_image_path,
+            random_seed=4, format_version=PNGBytesCodec.FORMAT_DENSE,
+        )
+
+        with Image.open(self.test_image_path) as img:
+            assert PNGBytesCodec._read_metadata(img)["length"] == "26"
+        assert PNGBytesCodec.decode_bytes(self.test_image_path) == (
+            b"written by the band writer"
+        )
+        assert len(PNGBytesCodec._load_pixel_data(self.test_image_path)) == 9
+
+
+class TestDenseFormat:
+    """Test suite for the dense (version 2) pixel format."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_image_path = Path(self.temp_dir) / "test.png"
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.parametrize("data", [
+        b"",
+        b"A",
+        b"AB",
+        b"ABC",
+        b"trailing zeros\x00\x00",
+        bytes(range(256)) * 8,
+    ])
+    def test_round_trip(self, data):
+        """Test that dense images decode to the exact original bytes."""
+        PNGBytesCodec.encode_bytes(
+            data, self.test_image_path,
+            random_seed=42, format_version=PNGBytesCodec.FORMAT_DENSE,
+        )
+
+        assert PNGBytesCodec.decode_bytes(self.test_image_path) == data
+
+    def test_uses_fewer_pixels_than_legacy(self):
+        """Test that dense images store three bytes per pixel."""
+        data = os.urandom(3000)
+        legacy_path = Path(self.temp_dir) / "legacy.png"
+
+        PNGBytesCodec.encode_bytes(data, legacy_path, random_seed=7)
+        PNGBytesCodec.encode_bytes(
+            data, self.test_image_path,
+            random_seed=7, format_version=PNGBytesCodec.FORMAT_DENSE,
+        )
+
+        assert len(PNGBytesCodec._load_pixel_data(legacy_path)) == 1500
+        assert len(PNGBytesCodec._load_pixel_data(self.test_image_path)) == 1000
+
+    def test_pointer_in_alpha_channel(self):
+        """Test that every occupied pixel has a non-zero alpha pointer."""
+        PNGBytesCodec.encode_bytes(
+            b"dense pointer test", self.test_image_path,
+            random_seed=1, format_version=PNGBytesCodec.FORMAT_DENSE,
+        )
+
+        with Image.open(self.test_image_path) as img:
+            assert PNGBytesCodec._read_metadata(img) == {
+                "format": "2", "length": "18",
+            }
+            pixel_data = PNGBytesCodec._scan_pixels(img, keep_alpha=True)
+
+        eof_pixels = [pos for pos, rgba in pixel_data.items() if rgba[3] >> 2 == 0]
+        assert len(pixel_data) == 6
+        assert len(eof_pixels) == 1
+
+    def test_legacy_images_still_decode(self):
+        """Test that images without a format chunk use the legacy layout."""
+        PNGBytesCodec.encode_bytes(b"legacy", self.test_image_path, random_seed=3)
+
+        with Image.open(self.test_image_path) as img:
+            assert PNGBytesCodec._read_metadata(img) == {}
+        assert PNGBytesCodec.decode_bytes(self.test_image_path) == b"legacy"
+
+    def test_unsupported_version(self):
+        """Test that unknown format versions are rejected."""
+        with pytest.raises(ValueError, match="Unsupported format version"):
+            PNGBytesCodec.encode_bytes(b"x", self.test_image_path, format_version=9)
+
+        PNGBytesCodec._save_image(
+            [(0, 0, 1, 0, 2)], self.test_image_path, metadata={"format": 9}
+        )
+        with pytest.raises(ValueError, match="Unsupported format version"):
+            PNGBytesCodec.decode_bytes(self.test_image_path)
+
+
+class TestPlan:
+    """Test suite for the dry-run planner."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_image_path = Path(self.temp_dir) / "test.png"
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.parametrize("format_version", [
+        PNGBytesCodec.FORMAT_LEGACY, PNGBytesCodec.FORMAT_DENSE,
+    ])
+    def test_matches_seeded_encode(self, format_version):
+        """Test that the predicted canvas equals the encoded image size."""
+        data = os.urandom(5001)
+
+        plan = PNGBytesCodec.plan(
+            len(data), random_seed=9, format_version=format_version
+        )
+        PNGBytesCodec.encode_bytes(
+            data, self.test_image_path,
+            random_seed=9, format_version=format_version,
+        )
+
+        with Image.open(self.test_image_path) as img:
+            assert img.size == (plan.width, plan.height)
+        pixel_data = PNGBytesCodec._load_pixel_data(self.test_image_path)
+        assert plan.pixel_count == len(pixel_data)
+        assert plan.fill_ratio == len(pixel_data) / (plan.width * plan.height)
+
+    def test_estimates_grow_with_length(self):
+        """Test that memory and time estimates scale with the payload."""
+        small = PNGBytesCodec.plan(1000, random_seed=1)
+        large = PNGBytesCodec.plan(100000, random_seed=1)
+
+        assert 0 < small.peak_memory < large.peak_memory
+        assert 0 < small.estimated_seconds < large.estimated_seconds
+
+    def test_empty_payload(self):
+        """Test planning a payload without any bytes."""
+        plan = PNGBytesCodec.plan(0)
+
+        assert plan.pixel_count == 0
+        assert plan.canvas_pixels == 0
+        assert plan.fill_ratio == 0.0
+
+    def test_unseeded_plan_is_an_estimate(self):
+        """Test that an unseeded plan uses the model instead of walking."""
+        plan = PNGBytesCodec.plan(10 ** 12)
+
+        assert not plan.exact
+        assert plan.pixel_count == 5 * 10 ** 11
+        ratio = plan.canvas_pixels / plan.pixel_count
+        assert ratio == pytest.approx(PNGBytesCodec._PLAN_CANVAS_PER_PIXEL_P95, rel=1e-3)
+        assert PNGBytesCodec.plan(1).canvas_pixels == 1
+
+    def test_max_canvas_pixels_stops_walk(self):
+        """Test that a seeded walk stops once its canvas passes the limit."""
+        full = PNGBytesCodec.plan(20000, random_seed=2)
+
+        stopped = PNGBytesCodec.plan(20000, random_seed=2, max_canvas_pixels=500)
+        assert not stopped.complete
+        assert 500 < stopped.canvas_pixels < full.canvas_pixels
+
+        within = PNGBytesCodec.plan(
+            20000, random_seed=2, max_canvas_pixels=full.canvas_pixels
+        )
+        assert within.complete and within.exact
+        assert within.canvas_pixels == full.canvas_pixels
+
+    def test_dead_end(self):
+        """Test that a seed whose walk dead-ends raises WalkDeadEndError."""
+        class ShortStepCodec(PNGBytesCodec):
+            MAX_DISTANCE = 1
+
+        with pytest.raises(WalkDeadEndError, match="dead-ends after"):
+            ShortStepCodec.plan(100000, random_seed=1)
+
+
+class TestSeedSearch:
+    """Test suite for the optimize seed search."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.test_image_path = self.temp_dir / "test.png"
+        self.data = os.urandom(3000)
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_picks_smallest_canvas(self):
+        """Test that the area metric picks the candidate with the least pixels."""
+        areas = {
+            seed: PNGBytesCodec.plan(len(self.data), random_seed=seed).canvas_pixels
+            for seed in range(10, 16)
+        }
+
+        seed = PNGBytesCodec.search_seed(self.data, seeds=6, random_seed=10, max_workers=2)
+
+        assert areas[seed] == min(areas.values())
+
+    def test_time_budget_still_scores_first_seed(self):
+        """Test that an exhausted budget never beats the seed alone."""
+        first = PNGBytesCodec.plan(len(self.data), random_seed=20).canvas_pixels
+
+        for _ in range(3):
+            seed = PNGBytesCodec.search_seed(
+                self.data, seeds=4, time_budget=0, random_seed=20, max_workers=2
+            )
+            assert 20 <= seed < 24
+            assert PNGBytesCodec.plan(len(self.data), random_seed=seed).canvas_pixels <= first
+
+    @pytest.mark.parametrize("format_version", [
+        PNGBytesCodec.FORMAT_LEGACY, PNGBytesCodec.FORMAT_DENSE,
+    ])
+    def test_optimized_encode(self, format_version):
+        """Test that the winner is encoded, recorded and no larger than the seed."""
+        plain_path = self.temp_dir / "plain.png"
+        data = self.data + b"\x00" * 4
+        PNGBytesCodec.encode_bytes(
+            data, plain_path, random_seed=7, format_version=format_version
+        )
+        PNGBytesCodec.encode_bytes(
+            data, self.test_image_path,
+            random_seed=7, format_version=format_version, optimize=True,
+        )
+
+        with Image.open(self.test_image_path) as img, Image.open(plain_path) as plain:
+            seed = int(img.text["byteart:seed"])
+            assert img.width * img.height <= plain.width * plain.height
+        assert 7 <= seed < 7 + PNGBytesCodec.OPTIMIZE_SEEDS
+        assert PNGBytesCodec.decode_bytes(self.test_image_path) == data
+
+    def test_optimize_options_reach_search(self, monkeypatch):
+        """Test that encode_text() passes its optimize options to search_seed()."""
+        calls = []
+
+        def search_seed(data, **kwargs):
+            calls.append(kwargs)
+            return kwargs["random_seed"] + 1
+
+        monkeypatch.setattr(PNGBytesCodec, "search_seed", search_seed)
+        PNGBytesCodec.encode_text(
+            "hello", self.test_image_path, random_seed=5, optimize=True,
+            optimize_seeds=3, optimize_time_budget=0.5, optimize_metric="compressed",
+        )
+
+        assert calls[0]["seeds"] == 3
+        assert calls[0]["time_budget"] == 0.5
+        assert calls[0]["metric"] == "compressed"
+        with Image.open(self.test_image_path) as img:
+            assert img.text["byteart:seed"] == "6"
+
+    def test_compressed_metric_and_budgets(self):
+        """Test the compressed metric and that budgets bound the search."""
+        seed = PNGBytesCodec.search_seed(
+            self.data, seeds=4, metric="compressed", random_seed=3, max_workers=2
+        )
+        assert 3 <= seed < 7
+
+        seed = PNGBytesCodec.search_seed(self.data, seeds=50, time_budget=0, random_seed=3)
+        assert 3 <= seed < 53
+        assert PNGBytesCodec.search_seed(self.data, seeds=1, random_seed=3) == 3
+
+        with pytest.raises(ValueError, match="Unknown optimize metric"):
+            PNGBytesCodec.search_seed(self.data, metric="speed")
+
+
+class TestByteArtCodec:
+    """Test suite for reusable codec instances."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.test_image_path = self.temp_dir / "test.png"
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.parametrize("format_version", [
+        PNGBytesCodec.FORMAT_LEGACY, PNGBytesCodec.FORMAT_DENSE,
+    ])
+    def test_matches_classmethod_output(self, format_version):
+        """Test that a seeded instance encode equals the classmethod encode."""
+        reference_path = self.temp_dir / "reference.png"
+        data = os.urandom(1999) + b"\x01"  # legacy strips trailing zeros
+
+        PNGBytesCodec.encode_bytes(
+            data, reference_path, random_seed=8, format_version=format_version
+        )
+        with ByteArtCodec(format_version=format_version) as codec:
+            codec.encode_bytes(data, self.test_image_path, random_seed=8)
+            assert codec.decode_bytes(self.test_image_path) == data
+
+        assert self.test_image_path.read_bytes() == reference_path.read_bytes()
+
+    def test_instance_rng_is_reproducible(self):
+        """Test that unseeded calls draw from the instance's own RNG."""
+        outputs = []
+        for _ in range(2):
+            with ByteArtCodec(random_seed=11) as codec:
+                for _ in range(2):
+                    path = self.temp_dir / f"{len(outputs)}.png"
+                    codec.encode_bytes(b"same payload", path)
+                    outputs.append(path.read_bytes())
+
+        assert outputs[0] != outputs[1]
+        assert outputs[:2] == outputs[2:]
+
+    def test_scratch_buffers_are_reused(self):
+        """Test that repeated encodes stop allocating scratch buffers."""
+        with ByteArtCodec(band_bytes=4096) as codec:
+            codec.encode_bytes(os.urandom(3000), self.test_image_path, random_seed=0)
+            allocations = codec.scratch.allocations
+            for seed in range(1, 10):
+                codec.encode_bytes(b"x" * 100, self.test_image_path, random_seed=seed)
+
+            assert codec.scratch.allocations == allocations
+            assert {"walk", "rgba", "canvas"} <= codec.scratch._buffers.keys()
+
+    def test_canvas_limit(self):
+        """Test that max_canvas_pixels applies to encode and decode."""
+        PNGBytesCodec.encode_bytes(os.urandom(500), self.test_image_path, random_seed=2)
+
+        with ByteArtCodec(max_canvas_pixels=10) as codec:
+            with pytest.raises(ValueError, match="exceeds 10 pixels"):
+                codec.encode_bytes(os.urandom(500), self.temp_dir / "out.png")
+            with pytest.raises(ValueError, match="exceeds 10 pixels"):
+                codec.decode_bytes(self.test_image_path)
+
+    def test_scratch_arena_growth(self):
+        """Test that buffers grow geometrically and are shared by name."""
+        arena = ScratchArena()
+
+        first = arena.take("a", (10,), np.int64, zero=True)
+        arena.take("a", (5, 2), np.int64)
+        arena.take("a", (11,), np.int64)
+
+        assert not first.any()
+        assert arena.allocations == 2
+        assert arena.nbytes == 160
+
+
+class TestAtlas:
+    """Test suite for atlas images holding many keyed payloads."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.test_image_path = self.temp_dir / "atlas.png"
+        self.entries = {f"token-{i}": os.urandom(i * 7 % 300) for i in range(120)}
+        self.entries["café ☕"] = b"unicode key"
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.parametrize("format_version", [
+        PNGBytesCodec.FORMAT_LEGACY, PNGBytesCodec.FORMAT_DENSE,
+    ])
+    def test_get_and_read_all(self, format_version):
+        """Test keyed lookups and bulk export against the input."""
+        PNGBytesCodec.encode_atlas(
+            self.entries, self.test_image_path,
+            random_seed=3, format_version=format_version,
+        )
+        atlas = PNGBytesCodec.open_atlas(self.test_image_path)
+
+        assert len(atlas) == len(self.entries)
+        assert atlas.get("café ☕") == b"unicode key"
+        assert all(atlas.get(key) == value for key, value in self.entries.items())
+        assert atlas.read_all() == self.entries
+
+    def test_one_canvas_for_all_entries(self):
+        """Test that the atlas is no larger than one encode of all payloads."""
+        single_path = self.temp_dir / "single.png"
+        # same number of pixels as the atlas: every entry padded to whole pixels
+        payload = b"".join(
+            value.ljust(max(3, -(-len(value) // 3) * 3), b"\x00")
+            for value in self.entries.values()
+        )
+
+        PNGBytesCodec.encode_atlas(self.entries, self.test_image_path, random_seed=3)
+        PNGBytesCodec.encode_bytes(
+            payload, single_path,
+            random_seed=3, format_version=PNGBytesCodec.FORMAT_DENSE,
+        )
+
+        with Image.open(self.test_image_path) as atlas, Image.open(single_path) as single:
+            assert atlas.size == single.size
+
+    def test_get_ignores_other_entries(self):
+        """Test that a lookup only follows its own chain."""
+        PNGBytesCodec.encode_atlas(
+            {"a": b"first entry", "b": b"second entry"}, self.test_image_path,
+            random_seed=3,
+        )
+        atlas = PNGBytesCodec.open_atlas(self.test_image_path)
+        x, y, _ = atlas.index["b"]
+        atlas._rgba = atlas._rgba.copy()
+        atlas._rgba[y, x, 3] = 0
+
+        assert atlas.get("a") == b"first entry"
+        with pytest.raises(ValueError, match="Broken pointer chain"):
+            atlas.get("b")
+        with pytest.raises(KeyError):
+            atlas.get("missing")
+
+    def test_plain_decode_rejects_atlas(self):
+        """Test that decode_bytes() points atlas images to open_atlas()."""
+        PNGBytesCodec.encode_atlas(self.entries, self.test_image_path, random_seed=3)
+
+        with pytest.raises(ValueError, match="open_atlas"):
+            PNGBytesCodec.decode_bytes(self.test_image_path)
+
+        PNGBytesCodec.encode_bytes(b"x", self.test_image_path)
+        with pytest.raises(ValueError, match="not an atlas"):
+            PNGBytesCodec.open_atlas(self.test_image_path)
+
+    def test_index_beyond_text_chunk_limit(self, monkeypatch):
+        """Test that the index is not bound by Pillow's text chunk cap."""
+        monkeypatch.setattr(PngImagePlugin, "MAX_TEXT_CHUNK", 256)
+        entries = {f"key-{i:05d}": bytes([i % 256]) * 3 for i in range(200)}
+
+        PNGBytesCodec.encode_atlas(entries, self.test_image_path, random_seed=3)
+        atlas = PNGBytesCodec.open_atlas(self.test_image_path)
+
+        assert atlas.read_all() == entries
+
+    def test_reads_json_index(self):
+        """Test that atlases with the older JSON text index still open."""
+        PNGBytesCodec.encode_atlas(self.entries, self.test_image_path, random_seed=3)
+        index = PNGBytesCodec.open_atlas(self.test_image_path).index
+        with Image.open(self.test_image_path) as img:
+            img.load()
+            pnginfo = self._pnginfo(img, {"byteart:atlas": json.dumps(index)})
+            img.save(self.test_image_path, pnginfo=pnginfo)
+
+        assert PNGBytesCodec.open_atlas(self.test_image_path).read_all() == self.entries
+
+    def test_rejects_corrupt_index(self):
+        """Test that a damaged or missing index chunk raises DecodeError."""
+        PNGBytesCodec.encode_atlas(self.entries, self.test_image_path, random_seed=3)
+        data = self.test_image_path.read_bytes()
+        chunk_type = PNGBytesCodec._ATLAS_INDEX_CHUNK
+        start = data.index(chunk_type) - 4
+        (length,) = struct.unpack(">I", data[start:start + 4])
+        payload = zlib.compress(b"\xff" * 64)
+        chunk = struct.pack(">I", len(payload)) + chunk_type + payload
+        chunk += struct.pack(">I", zlib.crc32(chunk[4:]))
+        self.test_image_path.write_bytes(
+            data[:start] + chunk + data[start + 12 + length:]
+        )
+
+        with pytest.raises(DecodeError, match="Truncated atlas index"):
+            PNGBytesCodec.open_atlas(self.test_image_path)
+
+        with Image.open(self.test_image_path) as img:
+            img.load()
+            img.save(self.test_image_path, pnginfo=self._pnginfo(img))
+        with pytest.raises(DecodeError, match="index chunk is missing"):
+            PNGBytesCodec.open_atlas(self.test_image_path)
+
+    @staticmethod
+    def _pnginfo(img, replace=None):
+        """Copy of the image's text chunks, with ``replace`` swapped in."""
+        pnginfo = PngImagePlugin.PngInfo()
+        for name, text in img.text.items():
+            pnginfo.add_text(name, (replace or {}).get(name, text), zip=True)
+        return pnginfo
+
+
+class TestArrays:
+    """Test suite for NumPy array encode/decode."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.test_image_path = self.temp_dir / "array.png"
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.parametrize("array", [
+        np.arange(12, dtype=">i4").reshape(3, 4),
+        np.asfortranarray(np.linspace(0, 1, 35).reshape(5, 7)),
+        np.arange(48.0).reshape(6, 8)[::2, 1::3],
+        np.zeros(7, dtype=[("a", "<i4"), ("b", "u1", (3,))]),
+        np.array(3.5),
+        np.zeros((0, 3), dtype=np.int16),
+    ], ids=["big-endian", "fortran", "strided", "structured", "scalar", "empty"])
+    def test_round_trip(self, array):
+        """Test that dtype, byte order, shape and order survive."""
+        PNGBytesCodec.encode_array(array, self.test_image_path, random_seed=1)
+        decoded = PNGBytesCodec.decode_array(self.test_image_path)
+
+        assert decoded.dtype == array.dtype
+        assert decoded.shape == array.shape
+        assert np.array_equal(decoded, array)
+
+    def _forge(self, key, value=None, *, hide_pixel=False):
+        """Re-save the image with one text chunk replaced or a pixel removed."""
+        pnginfo = PngImagePlugin.PngInfo()
+        with Image.open(self.test_image_path) as img:
+            rgba = np.array(img.convert("RGBA"))
+            for name, text in img.text.items():
+                pnginfo.add_text(name, value if name == key else text)
+        if hide_pixel:
+            ys, xs = np.nonzero(rgba[..., 3])
+            rgba[ys[len(ys) // 2], xs[len(xs) // 2], 3] = 0
+        Image.fromarray(rgba, "RGBA").save(self.test_image_path, pnginfo=pnginfo)
+
+    def test_header_checked_before_allocation(self):
+        """Test that a forged shape is rejected before memory or files are made."""
+        PNGBytesCodec.encode_array(np.arange(10, dtype=np.uint8), self.test_image_path)
+        header = {"descr": "<f8", "fortran_order": False, "shape": [10 ** 6, 10 ** 6]}
+        self._forge("byteart:array", json.dumps(header))
+        mmap_path = self.temp_dir / "out.npy"
+
+        with pytest.raises(DecodeError, match="does not match"):
+            PNGBytesCodec.decode_array(self.test_image_path, mmap_path=mmap_path)
+        with pytest.raises(DecodeError, match="does not match"):
+            PNGBytesCodec.decode_array(self.test_image_path, max_output_bytes=1000)
+        assert not mmap_path.exists()
+
+    def test_failed_mmap_decode_removes_file(self):
+        """Test that a broken chain does not leave a partial .npy file."""
+        PNGBytesCodec.encode_array(np.arange(300, dtype=np.int32), self.test_image_path)
+        self._forge(None, hide_pixel=True)
+        mmap_path = self.temp_dir / "out.npy"
+
+        with pytest.raises(DecodeError):
+            PNGBytesCodec.decode_array(self.test_image_path, mmap_path=mmap_path)
+        assert not mmap_path.exists()
+
+    def test_fortran_order_kept(self):
+        """Test that Fortran arrays are stored and rebuilt without a transpose copy."""
+        array = np.asfortranarray(np.arange(35, dtype=np.int64).reshape(5, 7))
+
+        PNGBytesCodec.encode_array(array, self.test_image_path, random_seed=1)
+        decoded = PNGBytesCodec.decode_array(self.test_image_path)
+
+        assert decoded.flags.f_contiguous and not decoded.flags.c_contiguous
+        with Image.open(self.test_image_path) as img:
+            assert json.loads(img.text["byteart:array"])["fortran_order"] is True
+
+    def test_trailing_zeros_legacy(self):
+        """Test that arrays ending in zeros are not stripped."""
+        array = np.concatenate([np.arange(1, 6), np.zeros(5)]).astype(np.uint8)
+
+        PNGBytesCodec.encode_array(
+            array, self.test_image_path,
+            random_seed=1, format_version=PNGBytesCodec.FORMAT_LEGACY,
+        )
+
+        assert np.array_equal(PNGBytesCodec.decode_array(self.test_image_path), array)
+
+    def test_destinations(self):
+        """Test decoding into out, a memory map and a read-only array."""
+        array = np.random.default_rng(0).random((20, 30)).astype(np.float32)
+        PNGBytesCodec.encode_array(array, self.test_image_path, random_seed=1)
+
+        out = np.empty_like(array)
+        assert PNGBytesCodec.decode_array(self.test_image_path, out=out) is out
+        assert np.array_equal(out, array)
+
+        mmap_path = self.temp_dir / "array.npy"
+        mapped = PNGBytesCodec.decode_array(
+            self.test_image_path, mmap_path=mmap_path, writable=False
+        )
+        assert isinstance(mapped, np.memmap) and not mapped.flags.writeable
+        assert np.array_equal(np.load(mmap_path), array)
+        del mapped
+
+        readonly = PNGBytesCodec.decode_array(self.test_image_path, writable=False)
+        assert not readonly.flags.writeable
+
+        with pytest.raises(ValueError, match="shape"):
+            PNGBytesCodec.decode_array(self.test_image_path, out=np.empty((30, 20), np.float32))
+
+    def test_rejects_non_arrays(self):
+        """Test object arrays and images without an array header."""
+        with pytest.raises(ValueError, match="Python objects"):
+            PNGBytesCodec.encode_array(np.array([{}, []], dtype=object), self.test_image_path)
+
+        PNGBytesCodec.encode_bytes(b"bytes", self.test_image_path)
+        with pytest.raises(DecodeError, match="not an array"):
+            PNGBytesCodec.decode_array(self.test_image_path)
+
+
+class TestDelta:
+    """Test suite for delta images against a base image."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.base_path = self.temp_dir / "base.png"
+        self.delta_path = self.temp_dir / "delta.png"
+        self.base = random.Random(0).randbytes(60000)
+        PNGBytesCodec.encode_bytes(
+            self.base, self.base_path,
+            random_seed=1, format_version=PNGBytesCodec.FORMAT_DENSE,
+        )
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_round_trip_small_edit(self):
+        """Test that an edited payload is rebuilt from a small delta."""
+        data = self.base[:20000] + b"inserted bytes" + self.base[20100:] + b"\x00" * 5
+
+        PNGBytesCodec.encode_delta(self.base_path, data, self.delta_path, random_seed=2)
+
+        assert PNGBytesCodec.decode_delta(self.base_path, self.delta_path) == data
+        stream, _ = PNGBytesCodec._decode_payload(self.delta_path, kind="delta")
+        assert len(stream) < 20000
+
+    def test_decode_to_file_and_unrelated_data(self):
+        """Test streaming to a file when nothing is shared with the base."""
+        data = os.urandom(5000)
+        output_path = self.temp_dir / "out.bin"
+
+        PNGBytesCodec.encode_delta(
+            self.base_path, data, self.delta_path,
+            random_seed=2, format_version=PNGBytesCodec.FORMAT_LEGACY,
+        )
+        PNGBytesCodec.decode_delta_to_file(self.base_path, self.delta_path, output_path)
+
+        assert output_path.read_bytes() == data
+
+    def test_corrupt_delta_keeps_existing_file(self):
+        """Test that a checksum mismatch leaves the output file untouched."""
+        data = self.base[:30000] + b"edit" + self.base[30000:]
+        output_path = self.temp_dir / "out.bin"
+        output_path.write_bytes(b"previous version")
+        PNGBytesCodec.encode_delta(self.base_path, data, self.delta_path, random_seed=2)
+
+        # re-save the delta with a wrong result checksum
+        pnginfo = PngImagePlugin.PngInfo()
+        with Image.open(self.delta_path) as img:
+            rgba = np.asarray(img.convert("RGBA"))
+            for key, value in img.text.items():
+                if key == "byteart:delta":
+                    header = json.loads(value)
+                    header["sha256"] = "0" * 64
+                    value = json.dumps(header)
+                pnginfo.add_text(key, value)
+        Image.fromarray(rgba, "RGBA").save(self.delta_path, pnginfo=pnginfo)
+
+        with pytest.raises(ValueError, match="delta checksum"):
+            PNGBytesCodec.decode_delta_to_file(
+                self.base_path, self.delta_path, output_path
+            )
+        assert output_path.read_bytes() == b"previous version"
+        assert sorted(p.name for p in self.temp_dir.iterdir()) == [
+            "base.png", "delta.png", "out.bin",
+        ]
+
+    def test_wrong_base_rejected(self):
+        """Test that a delta only applies to the base it was made against."""
+        other_path = self.temp_dir / "other.png"
+        PNGBytesCodec.encode_bytes(self.base[:-1], other_path, random_seed=1)
+        PNGBytesCodec.encode_delta(self.base_path, self.base, self.delta_path)
+
+        with pytest.raises(ValueError, match="different base"):
+            PNGBytesCodec.decode_delta(other_path, self.delta_path)
+
+    def test_plain_decode_rejects_delta(self):
+        """Test that decode_bytes() points delta images to decode_delta()."""
+        PNGBytesCodec.encode_delta(self.base_path, b"new", self.delta_path)
+
+        with pytest.raises(ValueError, match="decode_delta"):
+            PNGBytesCodec.decode_bytes(self.delta_path)
+        with pytest.raises(ValueError, match="not a delta"):
+            PNGBytesCodec.decode_delta(self.delta_path, self.base_path)
+
+
+class TestShardedEncoding:
+    """Test suite for sharded encode/decode."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.shard_dir = self.temp_dir / "shards"
+        self.output_path = self.temp_dir / "decoded.bin"
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_round_trip(self):
+        """Test that shards rebuild the original bytes in order."""
+        data = os.urandom(2500) + b"\x00" * 10
+
+        manifest_path = PNGBytesCodec.encode_sharded(
+            data, self.shard_dir, shard_size=1000, random_seed=5, max_workers=2
+        )
+        decoded = PNGBytesCodec.decode_sharded(
+            manifest_path, self.output_path, max_workers=2
+        )
+
+        assert decoded == 3
+        assert self.output_path.read_bytes() == data
+
+    def test_manifest_contents(self):
+        """Test that the manifest lists shard order, sizes and checksums."""
+        data = b"abcdefghij" * 25
+
+        manifest_path = PNGBytesCodec.encode_sharded(
+            data, self.shard_dir, shard_size=100, random_seed=5,
+            format_version=PNGBytesCodec.FORMAT_DENSE,
+        )
+        manifest = json.loads(manifest_path.read_text())
+
+        assert manifest["length"] == 250
+        assert [s["length"] for s in manifest["shards"]] == [100, 100, 50]
+        assert [s["offset"] for s in manifest["shards"]] == [0, 100, 200]
+        for shard in manifest["shards"]:
+            assert (self.shard_dir / shard["file"]).exists()
+
+    def test_resume_skips_completed_shards(self):
+        """Test that only damaged shard ranges are decoded again."""
+        data = os.urandom(3000)
+        manifest_path = PNGBytesCodec.encode_sharded(
+            data, self.shard_dir, shard_size=1000, random_seed=5
+        )
+        PNGBytesCodec.decode_sharded(manifest_path, self.output_path)
+
+        damaged = bytearray(data)
+        damaged[1500] ^= 0xFF
+        self.output_path.write_bytes(damaged[:2000])
+
+        assert PNGBytesCodec.decode_sharded(manifest_path, self.output_path) == 2
+        assert self.output_path.read_bytes() == data
+        assert PNGBytesCodec.decode_sharded(manifest_path, self.output_path) == 0
+
+    def test_corrupted_shard_checksum(self):
+        """Test that a shard not matching its checksum is rejected."""
+        manifest_path = PNGBytesCodec.encode_sharded(
+            b"x" * 300, self.shard_dir, shard_size=100, random_seed=5
+        )
+        PNGBytesCodec.encode_bytes(b"y" * 100, self.shard_dir / "shard_00001.png")
+
+        with pytest.raises(ValueError, match="Checksum mismatch"):
+            PNGBytesCodec.decode_sharded(manifest_path, self.output_path)
+
+    @pytest.mark.parametrize("name", [
+        "../outside.png", "/etc/passwd", "sub/shard.png", "..\\shard.png", "..",
+    ])
+    def test_rejects_shard_paths(self, name):
+        """Test that shard names escaping the manifest directory are rejected."""
+        manifest_path = PNGBytesCodec.encode_sharded(
+            b"x" * 300, self.shard_dir, shard_size=100, random_seed=5
+        )
+        manifest = json.loads(manifest_path.read_text())
+        manifest["shards"][1]["file"] = name
+        manifest_path.write_text(json.dumps(manifest))
+
+        with pytest.raises(ValueError, match="plain file name"):
+            PNGBytesCodec.decode_sharded(manifest_path, self.output_path)
+        assert not self.output_path.exists()
+
+    @pytest.mark.parametrize("field, value, message", [
+        ("length", -100, "non-negative integer"),
+        ("length", 100.0, "non-negative integer"),
+        ("length", 150, "starts at 200, expected 250"),
+        ("offset", 50, "starts at 50, expected 100"),
+        ("offset", "100", "starts at '100', expected 100"),
+        ("total", 10 ** 15, "does not match its shards"),
+    ])
+    def test_rejects_inconsistent_manifest(self, field, value, message):
+        """Test that shard ranges are checked before the output is opened."""
+        manifest_path = PNGBytesCodec.encode_sharded(
+            b"x" * 300, self.shard_dir, shard_size=100, random_seed=5
+        )
+        manifest = json.loads(manifest_path.read_text())
+        if field == "total":
+            manifest["length"] = value
+        else:
+            manifest["shards"][1][field] = value
+        manifest_path.write_text(json.dumps(manifest))
+
+        with pytest.raises(ValueError, match=message):
+            PNGBytesCodec.decode_sharded(manifest_path, self.output_path)
+        assert not self.output_path.exists()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,130 @@
+"""
+Unit tests for the out-of-core encoder using pytest.
+"""
+
+import mmap
+import os
+import random
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.codec import PNGBytesCodec
+from app.outofcore import DiskOccupancyMap, OutOfCoreEncoder
+
+
+class TinyEncoder(OutOfCoreEncoder):
+    """Encoder with buffers small enough to spill, evict and band in tests."""
+
+    BLOCK_PIXELS = 100
+    TILE_BITS = 2
+    WINDOW_BYTES = mmap.ALLOCATIONGRANULARITY
+    MIN_MEMORY_BUDGET = 0
+
+
+class TestDiskOccupancyMap:
+    """Test suite for DiskOccupancyMap."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_matches_set(self):
+        """Test membership against a set, across negative tiles and evictions."""
+        occupancy = DiskOccupancyMap(
+            self.temp_dir / "occupancy.bin",
+            tile_bits=2, window_bytes=mmap.ALLOCATIONGRANULARITY, max_windows=1,
+        )
+        rng = random.Random(0)
+        expected = set()
+        try:
+            for _ in range(20000):
+                position = (rng.randint(-500, 500), rng.randint(-500, 500))
+                assert (position in occupancy) == (position in expected)
+                occupancy.add(position)
+                expected.add(position)
+
+            assert len(occupancy) == len(expected)
+            assert occupancy.evictions > 0
+            assert all(position in occupancy for position in expected)
+        finally:
+            occupancy.close()
+
+    def test_rejects_unaligned_window(self):
+        """Test that windows must be page aligned."""
+        with pytest.raises(ValueError, match="multiple of the page size"):
+            DiskOccupancyMap(self.temp_dir / "occupancy.bin", window_bytes=1000)
+
+
+class TestOutOfCoreEncoder:
+    """Test suite for OutOfCoreEncoder."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.input_path = self.temp_dir / "input.bin"
+        self.reference_path = self.temp_dir / "reference.png"
+        self.test_image_path = self.temp_dir / "test.png"
+
+    def teardown_method(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.parametrize("format_version", [
+        PNGBytesCodec.FORMAT_LEGACY, PNGBytesCodec.FORMAT_DENSE,
+    ])
+    def test_matches_in_memory_encode(self, format_version):
+        """Test that spilled, banded output has the in-memory encode's pixels."""
+        data = os.urandom(4001) + b"\x01"
+        self.input_path.write_bytes(data)
+
+        PNGBytesCodec.encode_file(
+            self.input_path, self.reference_path,
+            random_seed=4, format_version=format_version,
+        )
+        TinyEncoder(memory_budget=20000, work_dir=self.temp_dir).encode_file(
+            self.input_path, self.test_image_path,
+            random_seed=4, format_version=format_version,
+        )
+
+        with Image.open(self.reference_path) as ref, Image.open(self.test_image_path) as img:
+            assert img.info == ref.info
+            assert np.array_equal(np.asarray(img), np.asarray(ref))
+        assert PNGBytesCodec.decode_bytes(self.test_image_path) == data
+        assert [p.name for p in self.temp_dir.iterdir() if p.is_dir()] == []
+
+    def test_empty_input(self):
+        """Test that empty input is dense-only, as in the in-memory encoder."""
+        self.input_path.write_bytes(b"")
+        encoder = OutOfCoreEncoder()
+
+        encoder.encode_file(
+            self.input_path, self.test_image_path,
+            format_version=PNGBytesCodec.FORMAT_DENSE,
+        )
+        assert PNGBytesCodec.decode_bytes(self.test_image_path) == b""
+        with pytest.raises(ValueError, match="empty data"):
+            encoder.encode_file(self.input_path, self.test_image_path)
+
+    def test_budget_limits(self):
+        """Test that too small budgets are rejected."""
+        with pytest.raises(ValueError, match="at least"):
+            OutOfCoreEncoder(memory_budget=1 << 20)
+
+        self.input_path.write_bytes(os.urandom(2000))
+        with pytest.raises(ValueError, match="does not fit the memory budget"):
+            TinyEncoder(memory_budget=100).encode_file(
+                self.input_path, self.test_image_path, random_seed=1
+            )
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])